@@ -3,17 +3,31 @@ Platform for DS-AIR of Daikin
 https://www.daikin-china.com.cn/newha/products/4/19/DS-AIR/
 """
 import logging
+import time
+from datetime import timedelta
+from typing import Optional
 
+import voluptuous as vol
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_HOST, CONF_PORT, CONF_SCAN_INTERVAL
-from homeassistant.core import HomeAssistant
+from homeassistant.const import CONF_HOST, CONF_PORT, CONF_SCAN_INTERVAL, EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.helpers import entity_registry
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import STORAGE_DIR
+from homeassistant.util import dt as dt_util
 
 from .hass_inst import GetHass
-from .const import CONF_GW, DEFAULT_HOST, DEFAULT_PORT, DEFAULT_GW, DOMAIN
+from .const import CONF_GW, CONF_RATE_LIMIT, CONF_BURST, DEFAULT_HOST, DEFAULT_PORT, DEFAULT_GW, DOMAIN, \
+    SERVICE_REFRESH_TOPOLOGY, SERVICE_GET_STATS, EVENT_STATS, SERVICE_START_PROFILE, SERVICE_STOP_PROFILE, \
+    SERVICE_START_CAPTURE, SERVICE_STOP_CAPTURE, SERVICE_BULK_CONTROL, ATTR_STALE, ATTR_STALE_SINCE
 from .ds_air_service.config import Config
+from .ds_air_service.scheduler import DEFAULT_RATE, DEFAULT_BURST
 
 _LOGGER = logging.getLogger(__name__)
 PLATFORMS = ["climate", "sensor"]
+SNAPSHOT_FILE = "ds_air.snapshot"
+SNAPSHOT_INTERVAL = timedelta(minutes=5)
 
 
 def _log(s: str):
@@ -36,6 +50,9 @@ async def async_setup_entry(
     port = entry.data[CONF_PORT]
     gw = entry.data[CONF_GW]
     scan_interval = entry.data[CONF_SCAN_INTERVAL]
+    # entries created before the rate limit existed do not have it
+    rate = entry.data.get(CONF_RATE_LIMIT, DEFAULT_RATE)
+    burst = entry.data.get(CONF_BURST, DEFAULT_BURST)
 
     _log(f"{host}:{port} {gw} {scan_interval}")
 
@@ -47,10 +64,63 @@ async def async_setup_entry(
     Config.is_c611 = gw == DEFAULT_GW
 
     from .ds_air_service.service import Service
-    await hass.async_add_executor_job(Service.init, host, port, scan_interval)
+    await hass.async_add_executor_job(Service.init, host, port, scan_interval, rate, burst)
+    # entities start with the state saved before the restart, marked stale until the gateway reports
+    snapshot_path = hass.config.path(STORAGE_DIR, SNAPSHOT_FILE)
+    hass.data[DOMAIN]["snapshot"] = snapshot_path
+    await hass.async_add_executor_job(Service.restore_snapshot, snapshot_path)
     hass.config_entries.async_setup_platforms(entry, PLATFORMS)
     entry.async_on_unload(entry.add_update_listener(update_listener))
 
+    async def save_snapshot(*args):
+        await hass.async_add_executor_job(Service.save_snapshot, snapshot_path)
+
+    entry.async_on_unload(async_track_time_interval(hass, save_snapshot, SNAPSHOT_INTERVAL))
+    entry.async_on_unload(hass.bus.async_listen(EVENT_HOMEASSISTANT_STOP, save_snapshot))
+
+    async def refresh_topology(call: ServiceCall):
+        await hass.async_add_executor_job(Service.refresh_topology)
+
+    async def get_stats(call: ServiceCall):
+        from .ds_air_service.stats import Stats
+        from .ds_air_service.trace import Tracer
+        stats = Stats.snapshot()
+        stats["latency"] = Tracer.snapshot()
+        _log(str(stats))
+        hass.bus.async_fire(EVENT_STATS, stats)
+
+    async def start_profile(call: ServiceCall):
+        from .ds_air_service.profiler import Profiler
+        path = hass.config.path("ds_air_profile_%s" % time.strftime("%Y%m%d_%H%M%S"))
+        if not await hass.async_add_executor_job(Profiler.start, path, call.data["duration"]):
+            _LOGGER.warning("a profile is already running")
+
+    async def stop_profile(call: ServiceCall):
+        from .ds_air_service.profiler import Profiler
+        path = await hass.async_add_executor_job(Profiler.stop)
+        if path is not None:
+            _LOGGER.info("profile written to %s", path)
+
+    async def start_capture(call: ServiceCall):
+        path = hass.config.path("ds_air_capture_%s.dscap" % time.strftime("%Y%m%d_%H%M%S"))
+        if await hass.async_add_executor_job(Service.start_capture, path):
+            _LOGGER.info("capturing to %s", path)
+        else:
+            _LOGGER.warning("a capture is already running")
+
+    async def stop_capture(call: ServiceCall):
+        path = await hass.async_add_executor_job(Service.stop_capture)
+        if path is not None:
+            _LOGGER.info("capture written to %s", path)
+
+    hass.services.async_register(DOMAIN, SERVICE_REFRESH_TOPOLOGY, refresh_topology)
+    hass.services.async_register(DOMAIN, SERVICE_GET_STATS, get_stats)
+    hass.services.async_register(DOMAIN, SERVICE_START_PROFILE, start_profile,
+                                 vol.Schema({vol.Optional("duration", default=60): vol.All(int, vol.Range(1, 3600))}))
+    hass.services.async_register(DOMAIN, SERVICE_STOP_PROFILE, stop_profile)
+    hass.services.async_register(DOMAIN, SERVICE_START_CAPTURE, start_capture)
+    hass.services.async_register(DOMAIN, SERVICE_STOP_CAPTURE, stop_capture)
+
     return True
 
 
@@ -59,7 +129,15 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     if hass.data[DOMAIN].get("listener") is not None:
         hass.data[DOMAIN].get("listener")()
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    hass.services.async_remove(DOMAIN, SERVICE_REFRESH_TOPOLOGY)
+    hass.services.async_remove(DOMAIN, SERVICE_GET_STATS)
+    hass.services.async_remove(DOMAIN, SERVICE_START_PROFILE)
+    hass.services.async_remove(DOMAIN, SERVICE_STOP_PROFILE)
+    hass.services.async_remove(DOMAIN, SERVICE_START_CAPTURE)
+    hass.services.async_remove(DOMAIN, SERVICE_STOP_CAPTURE)
+    hass.services.async_remove(DOMAIN, SERVICE_BULK_CONTROL)
     from .ds_air_service.service import Service
+    await hass.async_add_executor_job(Service.save_snapshot, hass.data[DOMAIN]["snapshot"])
     Service.destroy()
 
     return unload_ok
@@ -68,3 +146,20 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 async def update_listener(hass: HomeAssistant, entry: ConfigEntry):
     await hass.config_entries.async_reload(entry.entry_id)
     return True
+
+
+async def async_remove_entity(hass: HomeAssistant, entity: Entity):
+    """Remove an entity whose device is gone from the gateway."""
+    registry = entity_registry.async_get(hass)
+    await entity.async_remove(force_remove=True)
+    if entity.entity_id is not None and registry.async_get(entity.entity_id) is not None:
+        registry.async_remove(entity.entity_id)
+
+
+def stale_attributes(unique_id: str) -> Optional[dict]:
+    """State attributes of a device whose state was restored and not reported by the gateway since."""
+    from .ds_air_service.service import Service
+    stale_since = Service.get_stale_since(unique_id)
+    if stale_since is None:
+        return None
+    return {ATTR_STALE: True, ATTR_STALE_SINCE: dt_util.utc_from_timestamp(stale_since).isoformat()}
@@ -18,30 +18,45 @@ from homeassistant.components.climate.const import (
     HVAC_MODE_DRY,
     HVAC_MODE_FAN_ONLY)
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import TEMP_CELSIUS, ATTR_TEMPERATURE, CONF_HOST, CONF_PORT
-from homeassistant.core import HomeAssistant, Event
-from homeassistant.helpers import config_validation as cv
-from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.components.climate.const import ATTR_HVAC_MODE, ATTR_FAN_MODE, ATTR_SWING_MODE, ATTR_HUMIDITY
+from homeassistant.const import TEMP_CELSIUS, ATTR_TEMPERATURE, CONF_HOST, CONF_PORT, ATTR_ENTITY_ID
+from homeassistant.core import HomeAssistant, Event, ServiceCall, callback
+from homeassistant.helpers import config_validation as cv, entity_registry
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.event import async_track_state_change_event
 
-from .const import DOMAIN
+from .const import DOMAIN, SERVICE_BULK_CONTROL, EVENT_BULK_CONTROL, CONF_SMOOTHING
 from .ds_air_service.config import Config
-from .ds_air_service.ctrl_enum import EnumControl
+from .ds_air_service.ctrl_enum import EnumControl, AIR_FLOW_NAMES, FAN_DIRECTION_NAMES, HUMIDITY_BY_VALUE
 from .ds_air_service.dao import AirCon, AirConStatus
 from .ds_air_service.display import display
+from .ds_air_service.link import TemperatureLink
 
 SUPPORT_FLAGS = SUPPORT_TARGET_TEMPERATURE | SUPPORT_FAN_MODE | SUPPORT_SWING_MODE \
                 | SUPPORT_SWING_MODE | SUPPORT_TARGET_HUMIDITY
-FAN_LIST = ['最弱', '稍弱', '中等', '稍强', '最强', '自动']
-SWING_LIST = ['➡️', '↘️', '⬇️', '↙️', '⬅️', '↔️', '🔄']
+FAN_LIST = list(AIR_FLOW_NAMES)
+SWING_LIST = list(FAN_DIRECTION_NAMES[1:])
+# the hvac mode of every EnumControl.Mode, kept here so that ds_air_service does not need Home Assistant
+HVAC_MODE_BY_MODE = (HVAC_MODE_COOL, HVAC_MODE_DRY, HVAC_MODE_FAN_ONLY, HVAC_MODE_AUTO, HVAC_MODE_HEAT,
+                     HVAC_MODE_DRY, HVAC_MODE_AUTO, HVAC_MODE_HEAT_COOL, HVAC_MODE_HEAT, HVAC_MODE_DRY)
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Optional(CONF_HOST): cv.string,
     vol.Optional(CONF_PORT): cv.port
 })
 
+BULK_CONTROL_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+    vol.Optional(ATTR_HVAC_MODE): vol.In([HVAC_MODE_OFF, HVAC_MODE_COOL, HVAC_MODE_HEAT, HVAC_MODE_DRY,
+                                          HVAC_MODE_FAN_ONLY, HVAC_MODE_AUTO, HVAC_MODE_HEAT_COOL]),
+    vol.Optional(ATTR_TEMPERATURE): vol.Coerce(float),
+    vol.Optional(ATTR_HUMIDITY): vol.All(vol.Coerce(int), vol.Range(0, 3)),
+    vol.Optional(ATTR_FAN_MODE): vol.In(FAN_LIST),
+    vol.Optional(ATTR_SWING_MODE): vol.In(SWING_LIST),
+})
+
 _LOGGER = logging.getLogger(__name__)
+_TEMP_PREFIX = "temp_"  # unique id of the temperature entities of gateway sensors, see sensor.DsSensor
 
 
 def _log(s: str):
@@ -50,42 +65,94 @@ def _log(s: str):
         _LOGGER.debug(i)
 
 
+def _gateway_sensor_id(registry: entity_registry.EntityRegistry, entity_id: str) -> Optional[str]:
+    """Return the unique id of the gateway sensor behind one of our temperature entities."""
+    reg_entry = registry.async_get(entity_id)
+    if reg_entry is None or reg_entry.platform != DOMAIN or not reg_entry.unique_id.startswith(_TEMP_PREFIX):
+        return None
+    return reg_entry.unique_id[len(_TEMP_PREFIX):]
+
+
 async def async_setup_entry(
         hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
 ) -> None:
     """Set up the Demo climate devices."""
 
     from .ds_air_service.service import Service
+    from . import async_remove_entity
     climates = []
     for aircon in Service.get_aircons():
         climates.append(DsAir(aircon))
     async_add_entities(climates)
+
+    @callback
+    def topology_changed(added, removed):
+        new = [DsAir(i) for i in added if isinstance(i, AirCon)]
+        climates.extend(new)
+        async_add_entities(new)
+        for device in removed:
+            for climate in [j for j in climates if j.unique_id == device.unique_id and isinstance(device, AirCon)]:
+                climates.remove(climate)
+                hass.async_create_task(async_remove_entity(hass, climate))
+
+    Service.register_topology_hook(lambda added, removed: hass.add_job(topology_changed, added, removed))
+
+    async def bulk_control(call: ServiceCall):
+        """Apply the same settings to many units with one write, then report the acks in an event."""
+        entity_ids = call.data[ATTR_ENTITY_ID]
+        items, targets, skipped = [], {}, []
+        for climate in [i for i in climates if i.entity_id in entity_ids]:
+            status = climate.build_status(call.data.get(ATTR_HVAC_MODE), call.data.get(ATTR_TEMPERATURE),
+                                          call.data.get(ATTR_HUMIDITY), call.data.get(ATTR_FAN_MODE),
+                                          call.data.get(ATTR_SWING_MODE))
+            if status is None:
+                skipped.append(climate.entity_id)
+            else:
+                items.append((climate.aircon, status))
+                targets[climate.unique_id] = climate
+        results = await hass.async_add_executor_job(Service.control_many, items)
+        for r in results:
+            climate = targets[r.pop("unit")]
+            r["entity_id"] = climate.entity_id
+            climate.async_write_ha_state()
+        hass.bus.async_fire(EVENT_BULK_CONTROL, {"results": results, "skipped": skipped})
+
+    hass.services.async_register(DOMAIN, SERVICE_BULK_CONTROL, bulk_control, BULK_CONTROL_SCHEMA)
     link = entry.options.get("link")
     sensor_map = {}
     if link is not None:
+        by_name = {}
+        for climate in climates:
+            by_name.setdefault(climate.name, climate)
+        registry = entity_registry.async_get(hass)
         for i in link:
-            if i.get("sensor") is not None:
-                climate = None
-                for j in climates:
-                    if i.get("climate") == j.name:
-                        climate = j
-                        break
-                if sensor_map.get(i.get("sensor")) is not None:
-                    sensor_map[i.get("sensor")].append(climate)
-                else:
-                    sensor_map[i.get("sensor")] = [climate]
+            climate = by_name.get(i.get("climate"))
+            if i.get("sensor") is None or climate is None:
+                continue
+            temp_link = TemperatureLink(climate.update_cur_temp, i.get(CONF_SMOOTHING, 0.0))
+            # a temperature sensor of the gateway feeds the unit directly, others through the state machine
+            sensor_id = _gateway_sensor_id(registry, i.get("sensor"))
+            if sensor_id is not None and Service.link_sensor(sensor_id, temp_link):
+                continue
+            sensor_map.setdefault(i.get("sensor"), []).append(temp_link)
+
+    def feed(entity_id, state):
+        if state is None:
+            return
+        try:
+            value = float(state.state)
+        except ValueError:
+            return
+        for temp_link in sensor_map[entity_id]:
+            temp_link.feed(value)
 
     async def listener(event: Event):
-        for climate in sensor_map[event.data.get("entity_id")]:
-            climate.update_cur_temp(event.data.get("new_state").state)
+        feed(event.data.get("entity_id"), event.data.get("new_state"))
 
     remove_listener = async_track_state_change_event(hass, list(sensor_map.keys()), listener)
     hass.data[DOMAIN]["listener"] = remove_listener
     for entity_id in sensor_map.keys():
-        state = hass.states.get(entity_id)
-        if state is not None:
-            for climate in sensor_map[entity_id]:
-                climate.update_cur_temp(state.state)
+        feed(entity_id, hass.states.get(entity_id))
 
 
 class DsAir(ClimateEntity):
@@ -101,15 +168,48 @@ class DsAir(ClimateEntity):
         self._unique_id = aircon.unique_id
         self._link_cur_temp = False
         self._cur_temp = None
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, self._unique_id)},
+            "name": "空调%s" % self._name,
+            "manufacturer": "DAIKIN INDUSTRIES, Ltd."
+        }
+        self._update_capabilities()
         from .ds_air_service.service import Service
         Service.register_status_hook(aircon, self._status_change_hook)
 
+    def _update_capabilities(self):
+        """Derive what only changes with the capabilities of the unit, HA reads it on every state write."""
+        li = []
+        aircon = self._device_info
+        if aircon.cool_mode:
+            li.append(HVAC_MODE_COOL)
+        if aircon.heat_mode or aircon.pre_heat_mode:
+            li.append(HVAC_MODE_HEAT)
+        if aircon.auto_dry_mode or aircon.dry_mode or aircon.more_dry_mode:
+            li.append(HVAC_MODE_DRY)
+        if aircon.ventilation_mode:
+            li.append(HVAC_MODE_FAN_ONLY)
+        if aircon.relax_mode or aircon.auto_mode:
+            li.append(HVAC_MODE_AUTO)
+        if aircon.sleep_mode:
+            li.append(HVAC_MODE_HEAT_COOL)
+        li.append(HVAC_MODE_OFF)
+        self._attr_hvac_modes = li
+        self._attr_supported_features = SUPPORT_FLAGS
+        self._attr_min_temp = 16
+        self._attr_max_temp = 32
+        self._attr_min_humidity = 1
+        self._attr_max_humidity = 3
+        self._attr_fan_modes = FAN_LIST
+        self._attr_swing_modes = SWING_LIST
+
     def _status_change_hook(self, **kwargs):
         _log('hook:')
         if kwargs.get('aircon') is not None:
             aircon: AirCon = kwargs['aircon']
             aircon.status = self._device_info.status
             self._device_info = aircon
+            self._update_capabilities()
             _log(display(self._device_info))
 
         if kwargs.get('status') is not None:
@@ -136,13 +236,16 @@ class DsAir(ClimateEntity):
             _log(display(self._device_info.status))
         self.schedule_update_ha_state()
 
-    def update_cur_temp(self, value):
-        self._link_cur_temp = value is not None
-        try:
-            self._cur_temp = float(value)
-        except ValueError:
-            """Ignore"""
-        self.schedule_update_ha_state()
+    def update_cur_temp(self, value: float):
+        """Called by the TemperatureLink of the linked sensor, only when the value changes."""
+        self._link_cur_temp = True
+        self._cur_temp = value
+        if self.hass is not None:
+            self.schedule_update_ha_state()
+
+    @property
+    def aircon(self) -> AirCon:
+        return self._device_info
 
     @property
     def should_poll(self):
@@ -178,27 +281,7 @@ class DsAir(ClimateEntity):
         if self._device_info.status.switch == EnumControl.Switch.OFF:
             return HVAC_MODE_OFF
         else:
-            return EnumControl.get_mode_name(self._device_info.status.mode.value)
-
-    @property
-    def hvac_modes(self):
-        """Return the list of supported features."""
-        li = []
-        aircon = self._device_info
-        if aircon.cool_mode:
-            li.append(HVAC_MODE_COOL)
-        if aircon.heat_mode or aircon.pre_heat_mode:
-            li.append(HVAC_MODE_HEAT)
-        if aircon.auto_dry_mode or aircon.dry_mode or aircon.more_dry_mode:
-            li.append(HVAC_MODE_DRY)
-        if aircon.ventilation_mode:
-            li.append(HVAC_MODE_FAN_ONLY)
-        if aircon.relax_mode or aircon.auto_mode:
-            li.append(HVAC_MODE_AUTO)
-        if aircon.sleep_mode:
-            li.append(HVAC_MODE_HEAT_COOL)
-        li.append(HVAC_MODE_OFF)
-        return li
+            return HVAC_MODE_BY_MODE[self._device_info.status.mode]
 
     @property
     def current_temperature(self):
@@ -260,76 +343,106 @@ class DsAir(ClimateEntity):
     @property
     def fan_mode(self):
         """Return the fan setting."""
-        return EnumControl.get_air_flow_name(self._device_info.status.air_flow.value)
-
-    @property
-    def fan_modes(self) -> Optional[List[str]]:
-        """Return the list of available fan modes.
-
-        Requires SUPPORT_FAN_MODE.
-        """
-        return FAN_LIST
+        return EnumControl.get_air_flow_name(self._device_info.status.air_flow)
 
     @property
     def swing_mode(self):
         """Return the swing setting."""
-        return EnumControl.get_fan_direction_name(self._device_info.status.fan_direction1.value)
-
-    @property
-    def swing_modes(self) -> Optional[List[str]]:
-        """Return the list of available swing modes.
-
-        Requires SUPPORT_SWING_MODE.
-        """
-        return SWING_LIST
+        return EnumControl.get_fan_direction_name(self._device_info.status.fan_direction1)
 
     def set_temperature(self, **kwargs):
         """Set new target temperatures."""
         if kwargs.get(ATTR_TEMPERATURE) is not None:
-            status = self._device_info.status
-            new_status = AirConStatus()
-            if status.switch == EnumControl.Switch.ON \
-                    and status.mode not in [EnumControl.Mode.VENTILATION, EnumControl.Mode.MOREDRY]:
-                status.setted_temp = round(kwargs.get(ATTR_TEMPERATURE)) * 10
-                new_status.setted_temp = round(kwargs.get(ATTR_TEMPERATURE)) * 10
-                from .ds_air_service.service import Service
-                Service.control(self._device_info, new_status)
+            self._control(self._temperature_status(kwargs.get(ATTR_TEMPERATURE)))
         self.schedule_update_ha_state()
 
     def set_humidity(self, humidity):
         """Set new humidity level."""
-        status = self._device_info.status
-        new_status = AirConStatus()
-        if status.switch == EnumControl.Switch.ON \
-                and status.mode in [EnumControl.Mode.RELAX, EnumControl.Mode.SLEEP]:
-            status.humidity = EnumControl.Humidity(humidity)
-            new_status.humidity = EnumControl.Humidity(humidity)
-            from .ds_air_service.service import Service
-            Service.control(self._device_info, new_status)
+        self._control(self._humidity_status(humidity))
         self.schedule_update_ha_state()
 
     def set_fan_mode(self, fan_mode):
         """Set new fan mode."""
+        self._control(self._fan_mode_status(fan_mode))
+        self.schedule_update_ha_state()
+
+    def set_hvac_mode(self, hvac_mode: str) -> None:
+        """Set new target hvac mode."""
+        self._control(self._hvac_mode_status(hvac_mode))
+        self.schedule_update_ha_state()
+
+    def set_swing_mode(self, swing_mode):
+        """Set new swing mode."""
+        self._control(self._swing_mode_status(swing_mode))
+        self.schedule_update_ha_state()
+
+    def build_status(self, hvac_mode: Optional[str] = None, temperature: Optional[float] = None,
+                     humidity: Optional[int] = None, fan_mode: Optional[str] = None,
+                     swing_mode: Optional[str] = None) -> Optional[AirConStatus]:
+        """Apply several settings to the local state and return the status to send, without sending it.
+
+        The hvac mode goes first, so that a unit switched on also takes the temperature and fan settings.
+        None if nothing applies in the current state.
+        """
+        res = None
+        for value, func in ((hvac_mode, self._hvac_mode_status), (temperature, self._temperature_status),
+                            (humidity, self._humidity_status), (fan_mode, self._fan_mode_status),
+                            (swing_mode, self._swing_mode_status)):
+            if value is None:
+                continue
+            new_status = func(value)
+            if new_status is None:
+                continue
+            if res is None:
+                res = new_status
+            else:
+                for k, v in vars(new_status).items():
+                    if v is not None:
+                        setattr(res, k, v)
+        return res
+
+    def _control(self, new_status: Optional[AirConStatus]):
+        if new_status is not None:
+            from .ds_air_service.service import Service
+            Service.control(self._device_info, new_status)
+
+    def _temperature_status(self, temperature) -> Optional[AirConStatus]:
+        status = self._device_info.status
+        if status.switch == EnumControl.Switch.ON \
+                and status.mode not in [EnumControl.Mode.VENTILATION, EnumControl.Mode.MOREDRY]:
+            new_status = AirConStatus()
+            status.setted_temp = round(temperature) * 10
+            new_status.setted_temp = round(temperature) * 10
+            return new_status
+        return None
+
+    def _humidity_status(self, humidity) -> Optional[AirConStatus]:
+        status = self._device_info.status
+        if status.switch == EnumControl.Switch.ON \
+                and status.mode in [EnumControl.Mode.RELAX, EnumControl.Mode.SLEEP]:
+            new_status = AirConStatus()
+            status.humidity = HUMIDITY_BY_VALUE[humidity]
+            new_status.humidity = HUMIDITY_BY_VALUE[humidity]
+            return new_status
+        return None
+
+    def _fan_mode_status(self, fan_mode) -> Optional[AirConStatus]:
         status = self._device_info.status
-        new_status = AirConStatus()
         if status.switch == EnumControl.Switch.ON \
                 and status.mode not in [EnumControl.Mode.MOREDRY, EnumControl.Mode.SLEEP]:
+            new_status = AirConStatus()
             status.air_flow = EnumControl.get_air_flow_enum(fan_mode)
             new_status.air_flow = EnumControl.get_air_flow_enum(fan_mode)
-            from .ds_air_service.service import Service
-            Service.control(self._device_info, new_status)
-        self.schedule_update_ha_state()
+            return new_status
+        return None
 
-    def set_hvac_mode(self, hvac_mode: str) -> None:
-        """Set new target hvac mode."""
+    def _hvac_mode_status(self, hvac_mode: str) -> AirConStatus:
         aircon = self._device_info
         status = aircon.status
         new_status = AirConStatus()
         if hvac_mode == HVAC_MODE_OFF:
             status.switch = EnumControl.Switch.OFF
             new_status.switch = EnumControl.Switch.OFF
-            from .ds_air_service.service import Service
-            Service.control(self._device_info, new_status)
         else:
             status.switch = EnumControl.Switch.ON
             new_status.switch = EnumControl.Switch.ON
@@ -360,22 +473,18 @@ class DsAir(ClimateEntity):
                 mode = m.SLEEP
             status.mode = mode
             new_status.mode = mode
-            from .ds_air_service.service import Service
-            Service.control(self._device_info, new_status)
-        self.schedule_update_ha_state()
+        return new_status
 
-    def set_swing_mode(self, swing_mode):
-        """Set new swing mode."""
+    def _swing_mode_status(self, swing_mode) -> Optional[AirConStatus]:
         status = self._device_info.status
-        new_status = AirConStatus()
         if status.switch == EnumControl.Switch.ON:
+            new_status = AirConStatus()
             status.fan_direction1 = self._device_info.status.fan_direction1
             new_status.fan_direction1 = self._device_info.status.fan_direction1
             status.fan_direction2 = EnumControl.get_fan_direction_enum(swing_mode)
             new_status.fan_direction2 = EnumControl.get_fan_direction_enum(swing_mode)
-            from .ds_air_service.service import Service
-            Service.control(self._device_info, new_status)
-        self.schedule_update_ha_state()
+            return new_status
+        return None
 
     def set_preset_mode(self, preset_mode: str) -> None:
         pass
@@ -386,37 +495,11 @@ class DsAir(ClimateEntity):
     def turn_aux_heat_off(self) -> None:
         pass
 
-    @property
-    def supported_features(self) -> int:
-        """Return the list of supported features."""
-        return SUPPORT_FLAGS
-
-    @property
-    def min_temp(self):
-        """Return the minimum temperature."""
-        return 16
-
-    @property
-    def max_temp(self):
-        """Return the maximum temperature."""
-        return 32
-
-    @property
-    def min_humidity(self):
-        return 1
-
-    @property
-    def max_humidity(self):
-        return 3
-
-    @property
-    def device_info(self) -> Optional[DeviceInfo]:
-        return {
-            "identifiers": {(DOMAIN, self.unique_id)},
-            "name": "空调%s" % self._name,
-            "manufacturer": "DAIKIN INDUSTRIES, Ltd."
-        }
-
     @property
     def unique_id(self) -> Optional[str]:
         return self._unique_id
+
+    @property
+    def extra_state_attributes(self):
+        from . import stale_attributes
+        return stale_attributes(self._unique_id)
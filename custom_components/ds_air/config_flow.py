@@ -10,7 +10,9 @@ from homeassistant.const import CONF_HOST, CONF_PORT, CONF_SCAN_INTERVAL, CONF_S
 from homeassistant.core import callback, HomeAssistant
 from homeassistant.data_entry_flow import FlowResult
 
-from .const import DOMAIN, CONF_GW, DEFAULT_GW, DEFAULT_PORT, GW_LIST, DEFAULT_HOST
+from .const import DOMAIN, CONF_GW, DEFAULT_GW, DEFAULT_PORT, GW_LIST, DEFAULT_HOST, CONF_RATE_LIMIT, CONF_BURST, \
+    CONF_SMOOTHING
+from .ds_air_service.scheduler import DEFAULT_RATE, DEFAULT_BURST
 from .ds_air_service.service import Service
 from .hass_inst import GetHass
 
@@ -68,7 +70,9 @@ class DsAirFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
                 vol.Required(CONF_PORT, default=DEFAULT_PORT): int,
                 vol.Required(CONF_GW, default=DEFAULT_GW): vol.In(GW_LIST),
                 vol.Required(CONF_SCAN_INTERVAL, default=5): int,
-                vol.Required(CONF_SENSORS, default=True): bool
+                vol.Required(CONF_SENSORS, default=True): bool,
+                vol.Optional(CONF_RATE_LIMIT, default=DEFAULT_RATE): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                vol.Optional(CONF_BURST, default=DEFAULT_BURST): vol.All(int, vol.Range(min=1))
             }), errors=errors
         )
 
@@ -111,7 +115,8 @@ class DsAirOptionsFlowHandler(config_entries.OptionsFlow):
         if user_input is not None:
             self._config_data.append({
                 "climate": user_input.get("climate"),
-                "sensor": user_input.get("sensor")
+                "sensor": user_input.get("sensor"),
+                CONF_SMOOTHING: user_input.get(CONF_SMOOTHING, 0.0)
             })
         if self._cur == self._len:
             return self.async_create_entry(title="", data={"link": self._config_data})
@@ -124,7 +129,8 @@ class DsAirOptionsFlowHandler(config_entries.OptionsFlow):
                         "climate",
                         default=self._climates[self._cur]
                     ): vol.In([self._climates[self._cur]]),
-                    vol.Optional("sensor"): vol.In(self._sensors)
+                    vol.Optional("sensor"): vol.In(self._sensors),
+                    vol.Optional(CONF_SMOOTHING, default=0.0): vol.All(vol.Coerce(float), vol.Range(min=0, max=0.9))
                 }
             )
         )
@@ -1,15 +1,29 @@
 from homeassistant.const import TEMP_CELSIUS, PERCENTAGE, CONCENTRATION_MICROGRAMS_PER_CUBIC_METER, \
     CONCENTRATION_PARTS_PER_MILLION, CONCENTRATION_MILLIGRAMS_PER_CUBIC_METER, DEVICE_CLASS_HUMIDITY, \
-    DEVICE_CLASS_TEMPERATURE, DEVICE_CLASS_CO2
+    DEVICE_CLASS_TEMPERATURE, DEVICE_CLASS_CO2, DATA_BYTES, TIME_MILLISECONDS
 
 from .ds_air_service.ctrl_enum import EnumSensor
 
 DOMAIN = "ds_air"
 CONF_GW = "gw"
+CONF_RATE_LIMIT = "rate_limit"
+CONF_BURST = "burst"
+CONF_SMOOTHING = "smoothing"
 DEFAULT_HOST = "192.168.1."
 DEFAULT_PORT = 8008
 DEFAULT_GW = "DTA117C611"
 GW_LIST = ["DTA117C611", "DTA117B611"]
+SERVICE_REFRESH_TOPOLOGY = "refresh_topology"
+SERVICE_GET_STATS = "get_stats"
+SERVICE_START_PROFILE = "start_profile"
+SERVICE_STOP_PROFILE = "stop_profile"
+SERVICE_START_CAPTURE = "start_capture"
+SERVICE_STOP_CAPTURE = "stop_capture"
+SERVICE_BULK_CONTROL = "bulk_control"
+EVENT_STATS = "ds_air_stats"
+ATTR_STALE = "stale"
+ATTR_STALE_SINCE = "stale_since"
+EVENT_BULK_CONTROL = "ds_air_bulk_control"
 SENSOR_TYPES = {
     "temp": [TEMP_CELSIUS, None, DEVICE_CLASS_TEMPERATURE, 10],
     "humidity": [PERCENTAGE, None, DEVICE_CLASS_HUMIDITY, 10],
@@ -19,3 +33,20 @@ SENSOR_TYPES = {
     "voc": [None, None, None, EnumSensor.Voc],
     "hcho": [CONCENTRATION_MILLIGRAMS_PER_CUBIC_METER, None, None, 100],
 }
+
+# key in Stats.snapshot(): [unit, icon, sub key]
+STATS_SENSOR_TYPES = {
+    "frames_in": [None, "mdi:download-network", None],
+    "frames_out": [None, "mdi:upload-network", None],
+    "bytes_in": [DATA_BYTES, "mdi:download-network", None],
+    "bytes_out": [DATA_BYTES, "mdi:upload-network", None],
+    "reconnects": [None, "mdi:lan-disconnect", None],
+    "unknown_frames": [None, "mdi:help-network", None],
+    "decode_failures": [None, "mdi:alert-network", None],
+    "dispatch_errors": [None, "mdi:alert-circle-outline", None],
+    "send_queue_max": [None, "mdi:tray-full", None],
+    "throttled_waits": [None, "mdi:speedometer-slow", None],
+    "heartbeat_rtt": [TIME_MILLISECONDS, "mdi:heart-pulse", "avg_ms"],
+    "heartbeats_missed": [None, "mdi:heart-broken", None],
+    "dispatch_time": [TIME_MILLISECONDS, "mdi:timer-outline", "avg_ms"],
+}
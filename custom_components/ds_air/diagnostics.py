@@ -0,0 +1,67 @@
+"""Diagnostics support for DS-AIR."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_HOST
+from homeassistant.core import HomeAssistant
+
+from .ds_air_service.decoder import inspect_frame
+from .ds_air_service.display import summarize
+from .ds_air_service.ring import DIRECTION_IN
+from .ds_air_service.service import Service
+from .ds_air_service.stats import Stats
+from .ds_air_service.trace import Tracer
+
+TO_REDACT = {CONF_HOST}
+
+
+def _frame_summary(direction: int, frame: bytes):
+    # inspect_frame, the live decoder would count in Stats and could change Config.is_new_version
+    if direction != DIRECTION_IN:
+        return None
+    try:
+        result = inspect_frame(frame)
+    except Exception as e:
+        return {"error": str(e)}
+    if result is None:
+        return {"error": "not a complete frame"}
+    return summarize(result)
+
+
+async def async_get_config_entry_diagnostics(
+        hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return the frame history, decoded summaries and registry state."""
+    frames = []
+    ring = Service.get_frames()
+    if ring is not None:
+        for ts, direction, cmd_id, frame in ring.frames():
+            frames.append({
+                "time": ts,
+                "direction": "in" if direction == DIRECTION_IN else "out",
+                "cmd_id": cmd_id,
+                "hex": frame.hex(),
+                "decoded": _frame_summary(direction, frame)
+            })
+    quarantine = []
+    ring = Service.get_quarantine()
+    if ring is not None:
+        for ts, direction, cmd_id, frame in ring.frames():
+            quarantine.append({"time": ts, "hex": frame.hex()})
+    return {
+        "entry": {
+            "data": async_redact_data(dict(entry.data), TO_REDACT),
+            "options": dict(entry.options)
+        },
+        "ready": Service.is_ready(),
+        "rooms": summarize(Service.get_rooms() or []),
+        "aircons": summarize(Service.get_aircons()) if Service.is_ready() else [],
+        "sensors": summarize(Service.get_sensors()),
+        "stats": Stats.snapshot(),
+        "latency": Tracer.snapshot(),
+        "frames": frames,
+        "quarantine": quarantine
+    }
@@ -0,0 +1,259 @@
+"""Monitor and measure a gateway without Home Assistant
+
+    python -m ds_air_service tail --host 192.168.1.110
+    python -m ds_air_service stats --host 192.168.1.110 --interval 5
+    python -m ds_air_service query --host 192.168.1.110 > topology.json
+    python -m ds_air_service bench --host 192.168.1.110 --count 20
+    python -m ds_air_service proxy --host 192.168.1.110 --listen-port 8008
+
+tail prints one line per received frame, stats the frame rate and per command type counts every interval,
+query the rooms, units, sensors and their status as json. bench times heartbeat round trips and control
+commands that resend the current target temperature of a unit, from sending to the gateway's ack and to
+the status confirming it. proxy shares one gateway connection between any number of clients, see proxy.py.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+import typing
+from threading import Event
+
+from .config import Config
+from .dao import AirConStatus, get_device_by_aircon
+from .decoder import BaseResult, HeartbeatResult, AckResult, CmdRspResult, AirConStatusChangedResult, \
+    AirConQueryStatusResult
+from .display import summarize
+from .param import HeartbeatParam, AirConControlParam, AirConQueryStatusParam
+from .scheduler import PRIORITY_CONFIRM, DEFAULT_RATE, DEFAULT_BURST, DEFAULT_MAX_BATCH
+from .service import Service
+from .stats import Stats, _cmd_type_name
+
+_SKIP = {'class', 'cmd_id', 'cmd_type', 'target', 'need_ack', 'subbody_ver', 'lazy', 'STATUS_ATTR'}
+
+
+def compact(v) -> str:
+    """a summarized value on one line, None fields left out"""
+    if isinstance(v, dict):
+        return '{%s}' % ' '.join('%s=%s' % (k, compact(i)) for k, i in v.items() if k not in _SKIP and i is not None)
+    if isinstance(v, list):
+        return '[%s]' % ', '.join(compact(i) for i in v)
+    return str(v)
+
+
+def frame_line(result: BaseResult) -> str:
+    target = getattr(result.target, 'name', result.target)
+    cmd_type = getattr(result.cmd_type, 'value', result.cmd_type)
+    return '%s %s %s %s %s' % (time.strftime('%H:%M:%S'), target, _cmd_type_name(cmd_type),
+                               result.__class__.__name__, compact(summarize(result))[1:-1])
+
+
+def tail(args):
+    Service.register_frame_hook(lambda r: print(frame_line(r), flush=True))
+    start(args)
+    wait(args.duration)
+
+
+def stats(args):
+    start(args)
+    end = time.monotonic() + args.duration if args.duration else None
+    last_total, last_types, last = Stats.frames_in_total, dict(Stats.frames_in), time.monotonic()
+    while end is None or time.monotonic() < end:
+        time.sleep(args.interval)
+        now = time.monotonic()
+        total, types = Stats.frames_in_total, dict(Stats.frames_in)
+        per_type = ' '.join('%s:%d' % (_cmd_type_name(k), v - last_types.get(k, 0))
+                            for k, v in sorted(types.items()) if v != last_types.get(k, 0))
+        print('%s %.1f frames/s in, %d out, %d bytes in, %d malformed, %d duplicates | %s' % (
+            time.strftime('%H:%M:%S'), (total - last_total) / (now - last), Stats.frames_out_total,
+            Stats.bytes_in, Stats.decode_failures, Stats.duplicates, per_type), flush=True)
+        last_total, last_types, last = total, types, now
+
+
+def _merge_status(aircon):
+    def hook(**kwargs):
+        status = kwargs.get('status')
+        if status is not None:
+            for k, v in vars(status).items():
+                if v is not None:
+                    setattr(aircon.status, k, v)
+    return hook
+
+
+def query(args):
+    start(args)
+    deadline = time.monotonic() + args.timeout
+    # answers to the queries of discovery may come after it, and then only go to hooks: ask again
+    for i in Service.get_aircons():
+        Service.register_status_hook(i, _merge_status(i))
+        p = AirConQueryStatusParam()
+        p.target = get_device_by_aircon(i)
+        p.device = i
+        Service.send_msg(p, PRIORITY_CONFIRM)
+    while time.monotonic() < deadline and any(i.status.switch is None for i in Service.get_aircons()):
+        time.sleep(0.1)
+    json.dump({
+        'rooms': summarize(Service.get_rooms() or []),
+        'aircons': summarize(Service.get_aircons()),
+        'sensors': summarize(Service.get_sensors()),
+        'stats': Stats.snapshot()
+    }, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+class _Waiter:
+    """sets an event when a received frame matches, called from the receive thread"""
+
+    def __init__(self):
+        self.match = None  # type: typing.Optional[typing.Callable[[BaseResult], bool]]
+        self.event = Event()
+
+    def hook(self, result: BaseResult):
+        match = self.match
+        if match is not None and match(result):
+            self.event.set()
+
+    def arm(self, match: typing.Callable[[BaseResult], bool]):
+        self.event.clear()
+        self.match = match
+
+    def wait(self, timeout: float) -> bool:
+        res = self.event.wait(timeout)
+        self.match = None
+        return res
+
+
+def _timings(samples: typing.List[float], missed: int) -> dict:
+    if not samples:
+        return {'count': 0, 'missed': missed}
+    ms = sorted(i * 1000 for i in samples)
+    return {
+        'count': len(ms),
+        'missed': missed,
+        'min_ms': round(ms[0], 3),
+        'median_ms': round(statistics.median(ms), 3),
+        'p90_ms': round(ms[min(len(ms) - 1, int(len(ms) * 0.9))], 3),
+        'max_ms': round(ms[-1], 3)
+    }
+
+
+def bench(args):
+    heartbeat, acked, confirmed = _Waiter(), _Waiter(), _Waiter()
+    for i in (heartbeat, acked, confirmed):
+        Service.register_frame_hook(i.hook)
+    start(args)
+    rtt, missed = [], 0
+    for _ in range(args.count):
+        heartbeat.arm(lambda r: isinstance(r, HeartbeatResult))
+        t = time.monotonic()
+        Service.send_msg(HeartbeatParam())
+        if heartbeat.wait(args.timeout):
+            rtt.append(time.monotonic() - t)
+        else:
+            missed += 1
+    res = {'heartbeat': _timings(rtt, missed)}
+
+    aircons = Service.get_aircons()
+    if aircons:
+        aircon = aircons[min(args.unit, len(aircons) - 1)]
+        target = get_device_by_aircon(aircon)
+        ack, confirm, missed_ack, missed_confirm = [], [], 0, 0
+        for _ in range(args.count):
+            # the command id is assigned on creation, both waits are armed before anything is sent
+            p = AirConControlParam(aircon, AirConStatus(setted_temp=aircon.status.setted_temp))
+            acked.arm(lambda r: isinstance(r, (AckResult, CmdRspResult)) and r.cmd_id == p.cmd_id)
+            confirmed.arm(lambda r: isinstance(r, (AirConStatusChangedResult, AirConQueryStatusResult))
+                          and r.target == target and r.room == aircon.room_id and r.unit == aircon.unit_id)
+            t = time.monotonic()
+            Service.send_msg(p)
+            if acked.wait(args.timeout):
+                ack.append(time.monotonic() - t)
+            else:
+                missed_ack += 1
+            if confirmed.wait(max(0.0, args.timeout - (time.monotonic() - t))):
+                confirm.append(time.monotonic() - t)
+            else:
+                missed_confirm += 1
+        res['control'] = {'unit': aircon.unique_id, 'ack': _timings(ack, missed_ack),
+                          'confirm': _timings(confirm, missed_confirm)}
+    json.dump(res, sys.stdout, indent=2)
+    print()
+
+
+def proxy(args):
+    from .proxy import GatewayProxy
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        gp = GatewayProxy(args.host, args.port, args.listen, args.listen_port, args.cache_ttl)
+        await gp.start()
+        try:
+            while True:
+                await asyncio.sleep(args.interval)
+                logging.getLogger(__name__).info('%s', gp.snapshot())
+        finally:
+            await gp.stop()
+
+    asyncio.run(run())
+
+
+def start(args):
+    Config.is_c611 = args.gw == 'c611'
+    print('connecting to %s:%d' % (args.host, args.port), file=sys.stderr)
+    Service.init(args.host, args.port, args.scan_interval, args.rate, args.burst, args.max_batch)
+    print('%d rooms, %d units, %d sensors' % (len(Service.get_rooms() or []), len(Service.get_aircons()),
+                                              len(Service.get_sensors())), file=sys.stderr)
+
+
+def wait(duration: float):
+    if duration:
+        time.sleep(duration)
+    else:
+        Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m ds_air_service', description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, func, help_text in (('tail', tail, 'print received frames, one line each'),
+                                  ('stats', stats, 'print frame rates and counts periodically'),
+                                  ('query', query, 'print topology and status as json'),
+                                  ('bench', bench, 'time heartbeats and control round trips'),
+                                  ('proxy', proxy, 'share one gateway connection between many clients')):
+        p = sub.add_parser(name, help=help_text)
+        p.set_defaults(func=func)
+        p.add_argument('--host', required=True)
+        p.add_argument('--port', type=int, default=8008)
+        if name == 'proxy':
+            p.add_argument('--listen', default='0.0.0.0')
+            p.add_argument('--listen-port', type=int, default=8008)
+            p.add_argument('--cache-ttl', type=float, default=600, help='seconds room info and capabilities are kept')
+            p.add_argument('--interval', type=float, default=300, help='seconds between statistics lines')
+            continue
+        p.add_argument('--gw', choices=('c611', 'b611'), default='c611')
+        p.add_argument('--scan-interval', type=int, default=5, help='minutes between status polls')
+        p.add_argument('--rate', type=float, default=DEFAULT_RATE, help='frames per second sent, 0 for no limit')
+        p.add_argument('--burst', type=int, default=DEFAULT_BURST, help='frames sent at once before --rate applies')
+        p.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH, help='frames written with one system call')
+        if name in ('tail', 'stats'):
+            p.add_argument('--duration', type=float, default=0, help='seconds to run, 0 until interrupted')
+        if name == 'stats':
+            p.add_argument('--interval', type=float, default=5, help='seconds between lines')
+        if name in ('query', 'bench'):
+            p.add_argument('--timeout', type=float, default=10, help='seconds to wait for each answer')
+        if name == 'bench':
+            p.add_argument('--count', type=int, default=10, help='heartbeats and control commands to send')
+            p.add_argument('--unit', type=int, default=0, help='index of the unit controlled')
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        Service.destroy()
+
+
+if __name__ == '__main__':
+    main()
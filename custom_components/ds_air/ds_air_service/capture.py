@@ -0,0 +1,123 @@
+import struct
+import time
+import typing
+from threading import Lock, Event
+
+from .decoder import FrameReader
+from .ring import FrameRing, DIRECTION_IN
+
+# file: MAGIC, then per frame a record header followed by the raw frame
+MAGIC = b'DSCAP\x01'
+_RECORD = struct.Struct('<dBI')  # seconds since capture start (monotonic), direction, frame length
+
+
+class CaptureWriter:
+    def __init__(self, path: str):
+        self._f = open(path, 'wb')
+        self._f.write(MAGIC)
+        self._start = time.monotonic()
+        self._locker = Lock()
+        self._path = path
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def write(self, direction: int, data: bytes, start: int = 0, end: int = None):
+        if end is None:
+            end = len(data)
+        with self._locker:
+            if self._f is None:
+                return
+            self._f.write(_RECORD.pack(time.monotonic() - self._start, direction, end - start))
+            self._f.write(memoryview(data)[start:end])
+
+    def close(self):
+        with self._locker:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+
+def read_capture(path: str) -> typing.Iterator[typing.Tuple[float, int, bytes]]:
+    """(seconds since capture start, direction, frame)"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a ds_air capture' % path)
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            ts, direction, length = _RECORD.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield ts, direction, data
+
+
+class ReplayClient:
+    """stands in for SocketClient, feeds the inbound frames of a capture to the receive thread
+
+    speed 1.0 keeps the original timing, 0 replays as fast as possible; outbound params are only counted
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        from .service import RecvThread
+        self._frames_iter = iter([i for i in read_capture(path) if i[1] == DIRECTION_IN])
+        self._speed = speed
+        self._start = 0.0
+        self._ready = True
+        self._frames = FrameRing()
+        self._quarantine = FrameRing(64)
+        self._reader = FrameReader(self._quarantine, dedupe=True)
+        self._finished = Event()
+        self.sent = 0
+        self.last_recv = time.monotonic()
+        self._recv_thread = RecvThread(self)
+
+    @property
+    def frames(self) -> FrameRing:
+        return self._frames
+
+    @property
+    def quarantine(self) -> FrameRing:
+        return self._quarantine
+
+    @property
+    def finished(self) -> Event:
+        return self._finished
+
+    def destroy(self):
+        self._ready = False
+        self._recv_thread.terminate()
+        self._finished.set()
+
+    def reconnect(self):
+        pass
+
+    def send(self, p):
+        # like a gateway, start talking once the handshake is out
+        self.sent += 1
+        if self.sent == 1:
+            self._start = time.monotonic()
+            self._recv_thread.start()
+
+    def send_many(self, params):
+        for p in params:
+            self.send(p)
+
+    def recv(self):
+        item = next(self._frames_iter, None) if self._ready else None
+        if item is None:
+            self._finished.set()
+            self._recv_thread.terminate()
+            return [], None
+        ts, direction, data = item
+        if self._speed > 0:
+            delay = self._start + ts / self._speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.last_recv = time.monotonic()
+        self._frames.record(DIRECTION_IN, data)
+        self._reader.feed(data)
+        return [r for _, _, r in self._reader.frames(final=True)], data
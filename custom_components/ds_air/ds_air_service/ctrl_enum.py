@@ -1,8 +1,6 @@
+import typing
 from enum import Enum, IntEnum
 
-from homeassistant.components.climate.const import \
-    HVAC_MODE_COOL, HVAC_MODE_FAN_ONLY, HVAC_MODE_HEAT, HVAC_MODE_DRY, HVAC_MODE_AUTO, HVAC_MODE_HEAT_COOL
-
 
 class EnumCmdType(IntEnum):
     # 返回指令
@@ -235,7 +233,7 @@ class AirFlow(IntEnum):
     AUTO = 5
 
 
-_AIR_FLOW_NAME_LIST = ['最弱', '稍弱', '中等', '稍强', '最强', '自动']
+AIR_FLOW_NAMES = ('最弱', '稍弱', '中等', '稍强', '最强', '自动')
 
 
 class Breathe(IntEnum):
@@ -255,7 +253,7 @@ class FanDirection(IntEnum):
     SWING = 7
 
 
-_FAN_DIRECTION_LIST = ['INVALID', '➡️', '↘️', '⬇️', '↙️', '⬅️', '↔️', '🔄']
+FAN_DIRECTION_NAMES = ('INVALID', '➡️', '↘️', '⬇️', '↙️', '⬅️', '↔️', '🔄')
 
 
 class Humidity(IntEnum):
@@ -291,10 +289,6 @@ class Mode(IntEnum):
     MOREDRY = 9
 
 
-_MODE_NAME_LIST = [HVAC_MODE_COOL, HVAC_MODE_DRY, HVAC_MODE_FAN_ONLY, HVAC_MODE_AUTO, HVAC_MODE_HEAT,
-                   HVAC_MODE_DRY, HVAC_MODE_AUTO, HVAC_MODE_HEAT_COOL, HVAC_MODE_HEAT, HVAC_MODE_DRY]
-
-
 class Switch(IntEnum):
     OFF = 0
     ON = 1
@@ -324,29 +318,21 @@ class EnumControl:
     Mode = Mode
     Type = Type
 
-    @staticmethod
-    def get_mode_name(idx):
-        return _MODE_NAME_LIST[idx]
-
-    @staticmethod
-    def get_mode_enum(name):
-        return Mode(_MODE_NAME_LIST.index(name))
-
     @staticmethod
     def get_air_flow_name(idx):
-        return _AIR_FLOW_NAME_LIST[idx]
+        return AIR_FLOW_NAMES[idx]
 
     @staticmethod
     def get_air_flow_enum(name):
-        return AirFlow(_AIR_FLOW_NAME_LIST.index(name))
+        return AIR_FLOW_BY_NAME[name]
 
     @staticmethod
     def get_fan_direction_name(idx):
-        return _FAN_DIRECTION_LIST[idx]
+        return FAN_DIRECTION_NAMES[idx]
 
     @staticmethod
     def get_fan_direction_enum(name):
-        return FanDirection(_FAN_DIRECTION_LIST.index(name))
+        return FAN_DIRECTION_BY_NAME[name]
 
 
 class EnumSensor:
@@ -372,3 +358,39 @@ class EnumSensor:
                 return "中"
             elif self.value == EnumSensor.Voc.STEP_4:
                 return "高"
+
+
+# lookup tables
+#
+# calling an IntEnum goes through EnumMeta.__call__ and __new__ for every byte decoded, a dict lookup does
+# not. Tables raise KeyError on values the enum does not know, where the enum raised ValueError, so a frame
+# carrying one is still rejected by the frame reader.
+
+
+def _by_value(enum) -> typing.Dict[typing.Any, Enum]:
+    return {i.value: i for i in enum}
+
+
+def _by_name(names: typing.Sequence[str], enum) -> typing.Dict[str, IntEnum]:
+    """the first value of a name wins, as list.index did"""
+    res = {}
+    for i, name in enumerate(names):
+        res.setdefault(name, enum(i))
+    return res
+
+
+DEVICE_BY_VALUE = _by_value(EnumDevice)
+FAN_DIRECTION_BY_VALUE = _by_value(FanDirection)
+FAN_VOLUME_BY_VALUE = _by_value(EnumFanVolume)
+OUT_DOOR_RUN_COND_BY_VALUE = _by_value(EnumOutDoorRunCond)
+SWITCH_BY_VALUE = _by_value(Switch)
+MODE_BY_VALUE = _by_value(Mode)
+AIR_FLOW_BY_VALUE = _by_value(AirFlow)
+BREATHE_BY_VALUE = _by_value(Breathe)
+HUMIDITY_BY_VALUE = _by_value(Humidity)
+FRESH_AIR_HUMIDIFICATION_BY_VALUE = _by_value(FreshAirHumidification)
+THREE_D_FRESH_BY_VALUE = _by_value(ThreeDFresh)
+VOC_BY_VALUE = _by_value(EnumSensor.Voc)
+
+AIR_FLOW_BY_NAME = _by_name(AIR_FLOW_NAMES, AirFlow)
+FAN_DIRECTION_BY_NAME = _by_name(FAN_DIRECTION_NAMES, FanDirection)
@@ -1,30 +1,206 @@
 import struct
+import time
 import typing
 
 from .base_bean import BaseBean
 from .config import Config
-from .ctrl_enum import EnumDevice, EnumCmdType, EnumFanDirection, EnumOutDoorRunCond, EnumFanVolume, EnumControl, \
-    EnumSensor, FreshAirHumidification, ThreeDFresh
+from .ctrl_enum import EnumDevice, EnumCmdType, EnumFanDirection, EnumControl, EnumSensor, FreshAirHumidification, \
+    ThreeDFresh, DEVICE_BY_VALUE, FAN_DIRECTION_BY_VALUE, FAN_VOLUME_BY_VALUE, OUT_DOOR_RUN_COND_BY_VALUE, \
+    SWITCH_BY_VALUE, MODE_BY_VALUE, AIR_FLOW_BY_VALUE, BREATHE_BY_VALUE, HUMIDITY_BY_VALUE, \
+    FRESH_AIR_HUMIDIFICATION_BY_VALUE, THREE_D_FRESH_BY_VALUE, VOC_BY_VALUE
 from .dao import Room, AirCon, Geothermic, Ventilation, HD, Device, AirConStatus, get_device_by_aircon, Sensor
+from .dedupe import Dedupe
 from .param import GetRoomInfoParam, AirConRecommendedIndoorTempParam, AirConCapabilityQueryParam, \
     AirConQueryStatusParam, Sensor2InfoParam
+from .ring import FrameRing, DIRECTION_IN
+from .scheduler import PRIORITY_DISCOVERY
+from .stats import Stats
+from .trace import Tracer
 
 
 def decoder(b):
     if b[0] != 2:
+        Stats.decode_failed()
         return None, None
 
     length = struct.unpack('<H', b[1:3])[0]
     if length == 0 or len(b) - 4 < length or struct.unpack('<B', b[length + 3:length + 4])[0] != 3:
         if length == 0:
-            return HeartbeatResult(), None
+            return HeartbeatResult(), b[4:]
         else:
+            Stats.decode_failed()
             return None, None
 
-    return result_factory(struct.unpack('<BHBBBBIBIBH' + str(length - 16) + 'sB', b[:length + 4])), b[length + 4:]
+    return result_factory(_HEADER.unpack_from(b) + (b[19:length + 3], 3)), b[length + 4:]
 
 
-def result_factory(data):
+_HEADER = struct.Struct('<BHBBBBIBIBH')
+
+
+class FrameHeader(typing.NamedTuple):
+    length: int
+    subbody_ver: int
+    cmd_id: int
+    dev_type: int
+    dev_id: int
+    need_ack: int
+    cmd_type: int
+
+    @property
+    def size(self) -> int:
+        """the whole frame, start and end byte included"""
+        return self.length + 4
+
+
+_HEARTBEAT_HEADER = FrameHeader(0, 0, 0, 0, 0, 0, EnumCmdType.SYS_ACK.value)  # same as HeartbeatResult
+
+
+def frame_header(b: bytes) -> typing.Optional[FrameHeader]:
+    """header of one complete frame, None if it is not one; unlike decoder() it touches no Stats or Config"""
+    if len(b) < 4 or b[0] != 2 or b[-1] != 3:
+        return None
+    length = struct.unpack_from('<H', b, 1)[0]
+    if length == 0 and len(b) == 4:
+        return _HEARTBEAT_HEADER
+    if length < 16 or len(b) != length + 4:
+        return None
+    data = _HEADER.unpack_from(b)
+    return FrameHeader(length, data[4], data[6], data[7], data[8], data[9], data[10])
+
+
+def inspect_frame(b: bytes) -> typing.Optional['BaseResult']:
+    """result of one complete frame, fully decoded but not counted in Stats nor applied to Config
+
+    for looking at frames already handled, None if b is not a frame
+    """
+    header = frame_header(b)
+    if header is None:
+        return None
+    if header.length == 0:
+        return HeartbeatResult()
+    result = result_factory(_HEADER.unpack_from(b) + (b[19:-1], 3), quiet=True)
+    result.ensure_loaded()
+    return result
+
+
+class FrameReader:
+    """splits a byte stream into frames without copying what is left of the buffer
+
+    data is fed in chunks, an incomplete frame at the end waits for the next chunk. Garbage, implausible
+    headers and frames whose body fails to decode are skipped up to the next start byte, counted and kept
+    in the quarantine ring when one is given, nothing raises. Without decode only the framing is checked
+    and the result is None, for relaying frames unread or reading requests rather than replies.
+    """
+
+    def __init__(self, quarantine: FrameRing = None, dedupe: bool = False, decode: bool = True):
+        self._buf = b''
+        self._pos = 0
+        self._base = 0  # stream offset of _buf[0]
+        self._quarantine = quarantine
+        self._dedupe = dedupe
+        self._decode = decode
+        self.rejected = 0
+
+    @property
+    def buffer(self) -> bytes:
+        return self._buf
+
+    @property
+    def base(self) -> int:
+        return self._base
+
+    def feed(self, data: bytes):
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        if self._pos < len(self._buf):
+            self._base += self._pos
+            self._buf = self._buf[self._pos:] + data
+        else:
+            self._base += len(self._buf)
+            self._buf = data
+        self._pos = 0
+
+    def _reject(self, b: bytes, start: int, end: int):
+        self.rejected += 1
+        Stats.decode_failed(end - start)
+        if self._quarantine is not None:
+            self._quarantine.record(DIRECTION_IN, b, start, end)
+
+    def frames(self, final: bool = False) -> typing.Iterator[typing.Tuple[int, FrameHeader, 'BaseResult']]:
+        """(stream offset, header, result) for every complete frame fed so far
+
+        with final the input has ended, an incomplete frame left over is rejected
+        """
+        b = self._buf
+        n = len(b)
+        pos = self._pos
+        while pos < n:
+            if b[pos] == 2:
+                if n - pos < 4:
+                    if not final:
+                        break
+                else:
+                    length = struct.unpack_from('<H', b, pos + 1)[0]
+                    if length == 0:
+                        if b[pos + 3] == 3:
+                            self._pos = pos + 4
+                            yield self._base + pos, _HEARTBEAT_HEADER, HeartbeatResult() if self._decode else None
+                            pos += 4
+                            continue
+                    elif length >= 16 and b[pos + 3] == 0x0d:
+                        end = pos + length + 4
+                        if end > n:
+                            if not final:
+                                break
+                        elif b[end - 1] == 3:
+                            data = _HEADER.unpack_from(b, pos)
+                            self._pos = end
+                            subbody = b[pos + 19:end - 1]
+                            try:
+                                if not self._decode:
+                                    result = None
+                                elif self._dedupe and Dedupe.enabled and Dedupe.seen(data[8], data[10], subbody):
+                                    Stats.deduplicated()
+                                    # no status hook runs for it, its trace ends here
+                                    Tracer.answered(data[6])
+                                    result = DUPLICATE
+                                else:
+                                    result = result_factory(data + (subbody, 3))
+                            except Exception:
+                                self._reject(b, pos, end)
+                                pos = end
+                                continue
+                            yield self._base + pos, \
+                                FrameHeader(length, data[4], data[6], data[7], data[8], data[9], data[10]), result
+                            pos = end
+                            continue
+            # not a plausible frame start, skip to the next one
+            nxt = b.find(b'\x02', pos + 1)
+            if nxt < 0:
+                nxt = n
+            self._reject(b, pos, nxt)
+            pos = nxt
+        self._pos = pos
+
+
+def iter_frames(source, chunk_size: int = 65536) -> typing.Iterator[typing.Tuple[int, FrameHeader, 'BaseResult']]:
+    """(offset, header, result) for every frame in bytes, a binary file or a socket, lazily"""
+    reader = FrameReader()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        reader.feed(source)
+        yield from reader.frames(final=True)
+        return
+    read = source.recv if hasattr(source, 'recv') else source.read
+    while True:
+        data = read(chunk_size)
+        if not data:
+            break
+        reader.feed(data)
+        yield from reader.frames()
+    yield from reader.frames(final=True)
+
+
+def result_factory(data, quiet: bool = False):
     r1, length, r2, r3, subbody_ver, r4, cnt, dev_type, dev_id, need_ack, cmd_type, subbody, r5 = data
 
     if dev_id == EnumDevice.SYSTEM.value[1]:
@@ -62,7 +238,7 @@ def result_factory(data):
             result = UnknownResult(cnt, EnumDevice.SYSTEM, cmd_type)
     elif dev_id == EnumDevice.NEWAIRCON.value[1] or dev_id == EnumDevice.AIRCON.value[1] \
             or dev_id == EnumDevice.BATHROOM.value[1] or dev_id == EnumDevice.SENSOR.value[1]:
-        device = EnumDevice((8, dev_id))
+        device = DEVICE_BY_VALUE[(8, dev_id)]
         if cmd_type == EnumCmdType.STATUS_CHANGED.value:
             result = AirConStatusChangedResult(cnt, device)
         elif cmd_type == EnumCmdType.QUERY_STATUS.value:
@@ -82,7 +258,15 @@ def result_factory(data):
         result = UnknownResult(cnt, EnumDevice.SYSTEM, cmd_type)
 
     result.subbody_ver = subbody_ver
-    result.load_bytes(subbody)
+    if quiet:
+        result._quiet = True
+        result.parse(subbody)
+        return result
+    if isinstance(result, UnknownResult):
+        Stats.unknown_frame()
+    start = time.perf_counter()
+    result.parse(subbody)
+    Stats.decoded(result.__class__.__name__, time.perf_counter() - start)
 
     return result
 
@@ -129,8 +313,49 @@ class Decode:
 
 
 class BaseResult(BaseBean):
+    # lazy results keep the subbody raw until a property needs it or a frame hook subscribed to them,
+    # their properties call ensure_loaded first
+    lazy = False
+    _quiet = False  # decoded for inspection, leaves Stats and Config alone
+    _subscribed = set()  # type: typing.Set[typing.Tuple[typing.Optional[EnumDevice], typing.Optional[int]]]
+
     def __init__(self, cmd_id: int, targe: EnumDevice, cmd_type: EnumCmdType):
         BaseBean.__init__(self, cmd_id, targe, cmd_type)
+        self._raw = None
+
+    @staticmethod
+    def subscribe(target: typing.Optional[EnumDevice], cmd_type: typing.Optional[int]):
+        """decode (target, cmd_type) eagerly from now on, None matches any"""
+        BaseResult._subscribed.add((target, cmd_type))
+
+    @staticmethod
+    def unsubscribe_all():
+        BaseResult._subscribed = set()
+
+    def is_subscribed(self) -> bool:
+        subscribed = BaseResult._subscribed
+        if not subscribed:
+            return False
+        cmd_type = getattr(self.cmd_type, 'value', self.cmd_type)
+        return (self.target, cmd_type) in subscribed or (self.target, None) in subscribed \
+            or (None, cmd_type) in subscribed or (None, None) in subscribed
+
+    def parse(self, b):
+        if self.lazy and not self.is_subscribed():
+            self._raw = b
+        else:
+            self.load_bytes(b)
+
+    def ensure_loaded(self):
+        b = self._raw
+        if b is not None:
+            self._raw = None
+            try:
+                self.load_bytes(b)
+            except Exception:
+                # too late to reject the frame, whatever was decoded before the error is kept
+                if not self._quiet:
+                    Stats.decode_failed(len(b))
 
     def load_bytes(self, b):
         """do nothing"""
@@ -139,17 +364,36 @@ class BaseResult(BaseBean):
         """do nothing"""
 
 
+class DuplicateResult(BaseResult):
+    """stands for a polled payload identical to the previous one, nothing to decode or dispatch"""
+
+    def __init__(self):
+        BaseResult.__init__(self, 0, EnumDevice.SYSTEM, EnumCmdType.SYS_ACK)
+
+
+DUPLICATE = DuplicateResult()
+
+
 class HeartbeatResult(BaseResult):
     def __init__(self):
         BaseResult.__init__(self, 0, EnumDevice.SYSTEM, EnumCmdType.SYS_ACK)
 
+    def do(self):
+        Stats.heartbeat_received()
+
 
 class AckResult(BaseResult):
     def __init__(self, cmd_id: int, target: EnumDevice):
         BaseResult.__init__(self, cmd_id, target, EnumCmdType.SYS_ACK)
 
     def load_bytes(self, b):
-        Config.is_new_version = struct.unpack('<B', b)[0] == 2
+        if not self._quiet:
+            Config.is_new_version = struct.unpack('<B', b)[0] == 2
+
+    def do(self):
+        from .service import Service
+        Tracer.acked(self.cmd_id)
+        Service.acked(self.cmd_id)
 
 
 class ScheduleQueryVersionV3Result(BaseResult):
@@ -157,7 +401,28 @@ class ScheduleQueryVersionV3Result(BaseResult):
         BaseResult.__init__(self, cmd_id, target, EnumCmdType.SYS_ACK)
 
 
+_SENSOR_HEAD = struct.Struct('<BB6sB')  # sensor type, unit, mac, name length
+# readings present when their bit of type1 is set, in bit order
+_SENSOR_READINGS = (('temp', 'H'), ('humidity', 'H'), ('pm25', 'H'), ('co2', 'H'), ('voc', 'B'), ('tvoc', 'H'),
+                    ('hcho', 'H'))
+# switch, limits, connected, sleep mode count
+_SENSOR_TAIL = 'BHHHHHHHHBHHBB'
+_sensor_plans = [None] * 256  # type: typing.List[typing.Optional[typing.Tuple[struct.Struct, typing.List[str]]]]
+
+
+def _sensor_plan(type1: int) -> typing.Tuple[struct.Struct, typing.List[str]]:
+    """one Struct for everything after type1 (type2, readings, tail) and the names of the readings"""
+    plan = _sensor_plans[type1]
+    if plan is None:
+        readings = [i for n, i in enumerate(_SENSOR_READINGS) if type1 >> n & 1]
+        plan = _sensor_plans[type1] = (struct.Struct('<B' + ''.join(i[1] for i in readings) + _SENSOR_TAIL),
+                                       [i[0] for i in readings])
+    return plan
+
+
 class Sensor2InfoResult(BaseResult):
+    lazy = True
+
     def __init__(self, cmd_id: int, target: EnumDevice):
         BaseResult.__init__(self, cmd_id, target, EnumCmdType.SENSOR2_INFO)
         self._count = 0
@@ -167,75 +432,46 @@ class Sensor2InfoResult(BaseResult):
         self._sensors: typing.List[Sensor] = []
 
     def load_bytes(self, b):
-        d = Decode(b)
-        self._mode = d.read1()
-        count = d.read1()
+        self._mode = b[0]
+        count = b[1]
         self._count = count
-        while count > 0:
-            self._room_id = d.read1()
-            d = Decode(d.read(d.read1()))
-            self._sensor_type = d.read1()
-            unit_id = d.read1()
+        pos = 2
+        for _ in range(count):
+            room_id = b[pos]
+            start = pos + 2
+            pos = start + b[pos + 1]
+            if pos > len(b):
+                raise ValueError('sensor record runs past the frame')
+            self._room_id = room_id
+            sensor_type, unit_id, mac, length = _SENSOR_HEAD.unpack_from(b, start)
+            self._sensor_type = sensor_type
             sensor = Sensor()
-            sensor.mac = d.read(6).hex()
-            sensor.room_id = self._room_id
+            sensor.mac = mac.hex()
+            sensor.room_id = room_id
             sensor.unit_id = unit_id
-            length = d.read1()
-            sensor.alias = d.read_utf(length)
-            sensor.name = sensor.alias
-            sensor.type1 = d.read1()
-            sensor.type2 = d.read1()
-            humidity = Sensor.UNINITIALIZED_VALUE
-            hcho = Sensor.UNINITIALIZED_VALUE
-            temp = Sensor.UNINITIALIZED_VALUE
-            if (sensor.type1 & 1) == 1:
-                temp = d.read2()
-            if ((sensor.type1 >> 1) & 1) == 1:
-                humidity = d.read2()
-            pm25 = Sensor.UNINITIALIZED_VALUE
-            if (sensor.type1 >> 2) & 1 == 1:
-                pm25 = d.read2()
-            co2 = Sensor.UNINITIALIZED_VALUE
-            if (sensor.type1 >> 3) & 1 == 1:
-                co2 = d.read2()
-            voc = EnumSensor.Voc.STEP_UNUSE
-            if (sensor.type1 >> 4) & 1 == 1:
-                f = d.read1()
-                voc = EnumSensor.Voc(f)
-            tvoc = Sensor.UNINITIALIZED_VALUE
-            if (sensor.type1 >> 5) & 1 == 1:
-                tvoc = d.read2()
-            if (sensor.type1 >> 6) & 1 == 1:
-                hcho = d.read2()
-            switch_on_off = d.read1() == 1
-            temp_upper = d.read2()
-            temp_lower = d.read2()
-            humidity_upper = d.read2()
-            humidity_lower = d.read2()
-            pm25_upper = d.read2()
-            pm25_lower = d.read2()
-            co2_upper = d.read2()
-            co2_lower = d.read2()
-            voc_lower = d.read1()
-            tvoc_upper = d.read2()
-            hcho_upper = d.read2()
-            connected = d.read1() == 1
-            sleep_mode_count = d.read1()
-            sleep_mode_enable = False
-            if sleep_mode_count > 0:
-                sleep_mode_enable = d.read1() == 1
-            sensor.sensor_type = self._sensor_type
-            sensor.temp = temp
-            sensor.humidity = humidity
-            sensor.pm25 = pm25
-            sensor.co2 = co2
-            sensor.voc = voc
-            if self._sensor_type == 3:
-                sensor.tvoc = tvoc
-                sensor.hcho = hcho
+            start += _SENSOR_HEAD.size
+            sensor.alias = sensor.name = b[start:start + length].decode('utf-8')
+            start += length
+            sensor.type1 = type1 = b[start]
+            plan, names = _sensor_plan(type1)
+            values = plan.unpack_from(b, start + 1)
+            sensor.type2 = values[0]
+            head = len(names) + 1
+            readings = dict(zip(names, values[1:head]))
+            switch_on_off, temp_upper, temp_lower, humidity_upper, humidity_lower, pm25_upper, pm25_lower, \
+                co2_upper, co2_lower, voc_lower, tvoc_upper, hcho_upper, connected, sleep_mode_count = values[head:]
+            sensor.sensor_type = sensor_type
+            sensor.temp = readings.get('temp', Sensor.UNINITIALIZED_VALUE)
+            sensor.humidity = readings.get('humidity', Sensor.UNINITIALIZED_VALUE)
+            sensor.pm25 = readings.get('pm25', Sensor.UNINITIALIZED_VALUE)
+            sensor.co2 = readings.get('co2', Sensor.UNINITIALIZED_VALUE)
+            sensor.voc = VOC_BY_VALUE[readings['voc']] if 'voc' in readings else EnumSensor.Voc.STEP_UNUSE
+            if sensor_type == 3:
+                sensor.tvoc = readings.get('tvoc', Sensor.UNINITIALIZED_VALUE)
+                sensor.hcho = readings.get('hcho', Sensor.UNINITIALIZED_VALUE)
                 sensor.tvoc_upper = tvoc_upper
                 sensor.hcho_upper = hcho_upper
-            sensor.switch_on_off = switch_on_off
+            sensor.switch_on_off = switch_on_off == 1
             sensor.temp_upper = temp_upper
             sensor.temp_lower = temp_lower
             sensor.humidity_upper = humidity_upper
@@ -245,33 +481,38 @@ class Sensor2InfoResult(BaseResult):
             sensor.co2_upper = co2_upper
             sensor.co2_lower = co2_lower
             sensor.voc_lower = voc_lower
-            sensor.connected = connected
+            sensor.connected = connected == 1
             sensor.sleep_mode_count = sleep_mode_count
             self._sensors.append(sensor)
-            count = count - 1
 
     def do(self):
         from .service import Service
+        self.ensure_loaded()
         Service.set_sensors_status(self._sensors)
 
     @property
     def count(self):
+        self.ensure_loaded()
         return self._count
 
     @property
     def mode(self):
+        self.ensure_loaded()
         return self._mode
 
     @property
     def room_id(self):
+        self.ensure_loaded()
         return self._room_id
 
     @property
     def sensor_type(self):
+        self.ensure_loaded()
         return self._sensor_type
 
     @property
     def sensors(self):
+        self.ensure_loaded()
         return self._sensors
 
 
@@ -284,6 +525,11 @@ class CmdRspResult(BaseResult):
     def load_bytes(self, b):
         self._cmdId, self._code = struct.unpack('<IB', b)
 
+    def do(self):
+        from .service import Service
+        Tracer.acked(self._cmdId)
+        Service.acked(self._cmdId, self._code)
+
     @property
     def cmd_id(self):
         return self._cmdId
@@ -294,6 +540,8 @@ class CmdRspResult(BaseResult):
 
 
 class TimeSyncResult(BaseResult):
+    lazy = True
+
     def __init__(self, cmd_id: int, target: EnumDevice):
         BaseResult.__init__(self, cmd_id, target, EnumCmdType.SYS_TIME_SYNC)
         self._time = None
@@ -303,10 +551,13 @@ class TimeSyncResult(BaseResult):
 
     @property
     def time(self):
+        self.ensure_loaded()
         return self._time
 
 
 class ErrCodeResult(BaseResult):
+    lazy = True
+
     def __init__(self, cmd_id: int, target: EnumDevice):
         BaseResult.__init__(self, cmd_id, target, EnumCmdType.SYS_ERR_CODE)
         self._code = None
@@ -316,29 +567,35 @@ class ErrCodeResult(BaseResult):
 
     def load_bytes(self, b):
         dev_id, room, unit = struct.unpack('<iBB', b[:6])
-        self._device = EnumDevice((8, dev_id))
+        self._device = DEVICE_BY_VALUE[(8, dev_id)]
         self._room = room
         self._unit = unit
         self._code = b[6:].decode('ASCII')
 
     @property
     def code(self):
+        self.ensure_loaded()
         return self._code
 
     @property
     def device(self):
+        self.ensure_loaded()
         return self._device
 
     @property
     def room(self):
+        self.ensure_loaded()
         return self._room
 
     @property
     def unit(self):
+        self.ensure_loaded()
         return self._unit
 
 
 class GetWeatherResult(BaseResult):
+    lazy = True
+
     def __init__(self, cmd_id: int, target: EnumDevice):
         BaseResult.__init__(self, cmd_id, target, EnumCmdType.SYS_GET_WEATHER)
         self._condition = None
@@ -353,26 +610,33 @@ class GetWeatherResult(BaseResult):
 
     @property
     def condition(self):
+        self.ensure_loaded()
         return self._condition
 
     @property
     def humidity(self):
+        self.ensure_loaded()
         return self._humidity
 
     @property
     def temp(self):
+        self.ensure_loaded()
         return self._temp
 
     @property
     def wind_dire(self):
+        self.ensure_loaded()
         return self._wind_dire
 
     @property
     def wind_speed(self):
+        self.ensure_loaded()
         return self._wind_speed
 
 
 class LoginResult(BaseResult):
+    lazy = True
+
     def __init__(self, cmd_id: int, target: EnumDevice):
         BaseResult.__init__(self, cmd_id, target, EnumCmdType.SYS_LOGIN)
         self._status = None
@@ -382,10 +646,13 @@ class LoginResult(BaseResult):
 
     @property
     def status(self):
+        self.ensure_loaded()
         return self._status
 
 
 class ChangePWResult(BaseResult):
+    lazy = True
+
     def __init__(self, cmd_id: int, target: EnumDevice):
         BaseResult.__init__(self, cmd_id, target, EnumCmdType.SYS_CHANGE_PW)
         self._status = None
@@ -395,6 +662,7 @@ class ChangePWResult(BaseResult):
 
     @property
     def status(self):
+        self.ensure_loaded()
         return self._status
 
 
@@ -425,7 +693,7 @@ class GetRoomInfoResult(BaseResult):
                 room.icon = d.read_utf(length)
             unit_count = d.read2()
             for j in range(unit_count):
-                device = EnumDevice((8, d.read4()))
+                device = DEVICE_BY_VALUE[(8, d.read4())]
                 device_count = d.read2()
                 for unit_id in range(device_count):
                     if EnumDevice.AIRCON == device or EnumDevice.NEWAIRCON == device or EnumDevice.BATHROOM == device:
@@ -462,9 +730,13 @@ class GetRoomInfoResult(BaseResult):
 
     def do(self):
         from .service import Service
-        Service.set_rooms(self.rooms)
-        Service.send_msg(AirConRecommendedIndoorTempParam())
-        Service.set_sensors(self.sensors)
+        refresh = Service.is_ready()
+        if refresh:
+            Service.update_rooms(self.rooms, self.sensors)
+        else:
+            Service.set_rooms(self.rooms)
+            Service.send_msg(AirConRecommendedIndoorTempParam())
+            Service.set_sensors(self.sensors)
 
         aircons = []
         new_aircons = []
@@ -479,18 +751,14 @@ class GetRoomInfoResult(BaseResult):
                 else:
                     aircons.append(room.air_con)
 
-        p = AirConCapabilityQueryParam()
-        p.aircons = aircons
-        p.target = EnumDevice.AIRCON
-        Service.send_msg(p)
-        p = AirConCapabilityQueryParam()
-        p.aircons = new_aircons
-        p.target = EnumDevice.NEWAIRCON
-        Service.send_msg(p)
-        p = AirConCapabilityQueryParam()
-        p.aircons = bathrooms
-        p.target = EnumDevice.BATHROOM
-        Service.send_msg(p)
+        for target, li in ((EnumDevice.AIRCON, aircons), (EnumDevice.NEWAIRCON, new_aircons),
+                           (EnumDevice.BATHROOM, bathrooms)):
+            p = AirConCapabilityQueryParam()
+            p.aircons = li
+            p.target = target
+            if refresh:
+                Service.expect_topology(p)
+            Service.send_msg(p, PRIORITY_DISCOVERY)
 
     @property
     def count(self):
@@ -584,11 +852,11 @@ class AirConStatusChangedResult(BaseResult):
         status = self._status
         flag = d.read1()
         if flag & EnumControl.Type.SWITCH:
-            status.switch = EnumControl.Switch(d.read1())
+            status.switch = SWITCH_BY_VALUE[d.read1()]
         if flag & EnumControl.Type.MODE:
-            status.mode = EnumControl.Mode(d.read1())
+            status.mode = MODE_BY_VALUE[d.read1()]
         if flag & EnumControl.Type.AIR_FLOW:
-            status.air_flow = EnumControl.AirFlow(d.read1())
+            status.air_flow = AIR_FLOW_BY_VALUE[d.read1()]
         if flag & EnumControl.Type.CURRENT_TEMP:
             status.current_temp = d.read2()
         if flag & EnumControl.Type.SETTED_TEMP:
@@ -596,13 +864,27 @@ class AirConStatusChangedResult(BaseResult):
         if Config.is_new_version:
             if flag & EnumControl.Type.FAN_DIRECTION:
                 direction = d.read1()
-                status.fan_direction1 = EnumControl.FanDirection(direction & 0xF)
-                status.fan_direction2 = EnumControl.FanDirection((direction >> 4) & 0xF)
+                status.fan_direction1 = FAN_DIRECTION_BY_VALUE[direction & 0xF]
+                status.fan_direction2 = FAN_DIRECTION_BY_VALUE[(direction >> 4) & 0xF]
 
     def do(self):
         from .service import Service
+        Tracer.confirmed(self.target, self._room, self._unit)
+        Dedupe.invalidate(self.target, self._room, self._unit)
         Service.update_aircon(self.target, self._room, self._unit, status=self._status)
 
+    @property
+    def room(self):
+        return self._room
+
+    @property
+    def unit(self):
+        return self._unit
+
+    @property
+    def status(self):
+        return self._status
+
 
 class AirConQueryStatusResult(BaseResult):
     def __init__(self, cmd_id: int, target: EnumDevice):
@@ -629,33 +911,33 @@ class AirConQueryStatusResult(BaseResult):
         self.unit = d.read1()
         flag = d.read1()
         if flag & 1:
-            self.switch = EnumControl.Switch(d.read1())
+            self.switch = SWITCH_BY_VALUE[d.read1()]
         if flag >> 1 & 1:
-            self.mode = EnumControl.Mode(d.read1())
+            self.mode = MODE_BY_VALUE[d.read1()]
         if flag >> 2 & 1:
-            self.air_flow = EnumControl.AirFlow(d.read1())
+            self.air_flow = AIR_FLOW_BY_VALUE[d.read1()]
         if Config.is_c611:
             if flag >> 3 & 1:
                 bt = d.read1()
                 self.hum_allow = bt & 8 == 8
                 self.fresh_air_allow = bt & 4 == 4
-                self.fresh_air_humidification = FreshAirHumidification(bt & 3)
+                self.fresh_air_humidification = FRESH_AIR_HUMIDIFICATION_BY_VALUE[bt & 3]
 
             if flag >> 4 & 1:
                 self.setted_temp = d.read2()
             if Config.is_new_version:
                 if flag >> 5 & 1:
                     b = d.read1()
-                    self.fan_direction1 = EnumControl.FanDirection(b & 0xf)
-                    self.fan_direction2 = EnumControl.FanDirection(b >> 4 & 0xf)
+                    self.fan_direction1 = FAN_DIRECTION_BY_VALUE[b & 0xf]
+                    self.fan_direction2 = FAN_DIRECTION_BY_VALUE[b >> 4 & 0xf]
                 if flag >> 6 & 1:
-                    self.humidity = EnumControl.Humidity(d.read1())
+                    self.humidity = HUMIDITY_BY_VALUE[d.read1()]
                 if self.target == EnumDevice.BATHROOM:
                     if flag >> 7 & 1:
-                        self.breathe = EnumControl.Breathe(d.read1())
+                        self.breathe = BREATHE_BY_VALUE[d.read1()]
                 elif self.target == EnumDevice.AIRCON:
                     if flag >> 7 & 1 == 1:
-                        self.three_d_fresh = ThreeDFresh(d.read1())
+                        self.three_d_fresh = THREE_D_FRESH_BY_VALUE[d.read1()]
         else:
             if flag >> 3 & 1:
                 self.current_temp = d.read2()
@@ -664,23 +946,26 @@ class AirConQueryStatusResult(BaseResult):
             if Config.is_new_version:
                 if flag >> 5 & 1:
                     b = d.read1()
-                    self.fan_direction1 = EnumControl.FanDirection(b & 0xf)
-                    self.fan_direction2 = EnumControl.FanDirection(b >> 4 & 0xf)
+                    self.fan_direction1 = FAN_DIRECTION_BY_VALUE[b & 0xf]
+                    self.fan_direction2 = FAN_DIRECTION_BY_VALUE[b >> 4 & 0xf]
                 if self.target == EnumDevice.NEWAIRCON:
                     if flag >> 6 & 1:
-                        self.humidity = EnumControl.Humidity(d.read1())
+                        self.humidity = HUMIDITY_BY_VALUE[d.read1()]
                 else:
                     if flag >> 7 & 1:
-                        self.breathe = EnumControl.Breathe(d.read1())
+                        self.breathe = BREATHE_BY_VALUE[d.read1()]
 
     def do(self):
         from .service import Service
         status = AirConStatus(self.current_temp, self.setted_temp, self.switch, self.air_flow, self.breathe,
                               self.fan_direction1, self.fan_direction2, self.humidity, self.mode)
+        Tracer.confirmed(self.target, self.room, self.unit)
         Service.set_aircon_status(self.target, self.room, self.unit, status)
 
 
 class AirConRecommendedIndoorTempResult(BaseResult):
+    lazy = True
+
     def __init__(self, cmd_id: int, target: EnumDevice):
         BaseResult.__init__(self, cmd_id, target, EnumCmdType.AIR_RECOMMENDED_INDOOR_TEMP)
         self._temp: int = 0
@@ -693,10 +978,12 @@ class AirConRecommendedIndoorTempResult(BaseResult):
 
     @property
     def temp(self):
+        self.ensure_loaded()
         return self._temp
 
     @property
     def outdoor_temp(self):
+        self.ensure_loaded()
         return self._outdoor_temp
 
 
@@ -718,7 +1005,7 @@ class AirConCapabilityQueryResult(BaseResult):
                 aircon.new_air_con = self.target == EnumDevice.NEWAIRCON
                 aircon.bath_room = self.target == EnumDevice.BATHROOM
                 flag = d.read1()
-                aircon.fan_volume = EnumFanVolume(flag >> 5 & 0x7)
+                aircon.fan_volume = FAN_VOLUME_BY_VALUE[flag >> 5 & 0x7]
                 aircon.dry_mode = flag >> 4 & 1
                 aircon.auto_mode = flag >> 3 & 1
                 aircon.heat_mode = flag >> 2 & 1
@@ -743,7 +1030,7 @@ class AirConCapabilityQueryResult(BaseResult):
                     aircon.three_d_fresh_allow = flag >> 7 & 1
 
                     flag = d.read1()
-                    aircon.out_door_run_cond = EnumOutDoorRunCond(flag >> 6 & 3)
+                    aircon.out_door_run_cond = OUT_DOOR_RUN_COND_BY_VALUE[flag >> 6 & 3]
                     aircon.more_dry_mode = flag >> 4 & 1
                     aircon.pre_heat_mode = flag >> 3 & 1
                     aircon.auto_dry_mode = flag >> 2 & 1
@@ -759,6 +1046,8 @@ class AirConCapabilityQueryResult(BaseResult):
             if len(self._air_cons):
                 for i in self._air_cons:
                     Service.update_aircon(get_device_by_aircon(i), i.room_id, i.unit_id, aircon=i)
+            if Service.is_topology_result(self.cmd_id):
+                Service.merge_aircons(self.target, self._air_cons)
         else:
             for i in self._air_cons:
                 p = AirConQueryStatusParam()
@@ -782,6 +1071,8 @@ class AirConQueryScenarioSettingResult(BaseResult):
 
 
 class UnknownResult(BaseResult):
+    lazy = True
+
     def __init__(self, cmd_id: int, target: EnumDevice, cmd_type: EnumCmdType):
         BaseResult.__init__(self, cmd_id, target, cmd_type)
         self._subbody = ''
@@ -791,4 +1082,5 @@ class UnknownResult(BaseResult):
 
     @property
     def subbody(self):
+        self.ensure_loaded()
         return self._subbody
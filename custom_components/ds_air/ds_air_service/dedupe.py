@@ -0,0 +1,58 @@
+import typing
+from collections import OrderedDict
+
+from .ctrl_enum import EnumDevice, EnumCmdType
+
+_MAX = 1024
+
+# polled answers worth recognising: status queries of every aircon kind and sensor info
+_POLLED = {
+    (EnumDevice.AIRCON.value[1], EnumCmdType.QUERY_STATUS.value),
+    (EnumDevice.NEWAIRCON.value[1], EnumCmdType.QUERY_STATUS.value),
+    (EnumDevice.BATHROOM.value[1], EnumCmdType.QUERY_STATUS.value),
+    (EnumDevice.SYSTEM.value[1], EnumCmdType.SENSOR2_INFO.value),
+    (EnumDevice.SENSOR.value[1], EnumCmdType.SENSOR2_INFO.value),
+}
+
+
+class Dedupe:
+    """recognises a polled payload identical to the previous one from the same source
+
+    entries are keyed by (dev_id, cmd_type, slot), slot being room and unit for status queries and the
+    leading bytes for sensor info, and hold the last subbody. Comparing with the previous payload of the
+    same source rather than with any payload seen keeps A -> B -> A transitions.
+    """
+    enabled = False  # type: bool
+    _last = OrderedDict()  # type: typing.OrderedDict[tuple, bytes]
+
+    @staticmethod
+    def seen(dev_id: int, cmd_type: int, subbody: bytes) -> bool:
+        """True if subbody repeats the last payload of its source, which then does not need decoding"""
+        if (dev_id, cmd_type) not in _POLLED:
+            return False
+        key = (dev_id, cmd_type, subbody[:2] if cmd_type == EnumCmdType.QUERY_STATUS else subbody[:3])
+        last = Dedupe._last
+        if last.get(key) == subbody:
+            return True
+        last[key] = subbody
+        last.move_to_end(key)
+        if len(last) > _MAX:
+            last.popitem(last=False)
+        return False
+
+    @staticmethod
+    def invalidate(target: EnumDevice, room: int, unit: int):
+        """the next status of this unit is decoded and dispatched whatever it contains"""
+        Dedupe._last.pop((target.value[1], EnumCmdType.QUERY_STATUS.value, bytes((room, unit))), None)
+
+    @staticmethod
+    def invalidate_sensors():
+        """the next sensor info is decoded and dispatched whatever it contains"""
+        # list() copies in one step, the receive thread may add entries meanwhile
+        for key in list(Dedupe._last):
+            if key[1] == EnumCmdType.SENSOR2_INFO.value:
+                Dedupe._last.pop(key, None)
+
+    @staticmethod
+    def clear():
+        Dedupe._last = OrderedDict()
@@ -20,3 +20,19 @@ def display(o, d='') -> str:
                 st += '\n' + d + i + ': ' + display(o.__getattribute__(i), d + '    ')
         st += '}'
         return st
+
+
+def summarize(o):
+    """like display but returns plain json-able data"""
+    if o is None or type(o) == int or type(o) == str or type(o) == bool or type(o) == float:
+        return o
+    elif isinstance(o, Enum):
+        return o.name
+    elif type(o) == list:
+        return [summarize(i) for i in o]
+    else:
+        res = {'class': o.__class__.__name__}
+        for i in dir(o):
+            if (not i.startswith('_')) and (not callable(o.__getattribute__(i))):
+                res[i] = summarize(o.__getattribute__(i))
+        return res
@@ -0,0 +1,33 @@
+"""current temperature of a unit taken from a sensor
+
+A TemperatureLink passes a reading on only when it changes the value shown, after optional exponential
+smoothing. Sensors of the gateway feed it from their hook in Service, anything else through feed().
+"""
+import typing
+
+from .dao import Sensor
+
+_TEMP_SCALE = 10  # Sensor.temp is in tenths of a degree
+
+
+class TemperatureLink:
+    def __init__(self, callback: typing.Callable[[float], None], smoothing: float = 0.0, precision: int = 1):
+        """smoothing is the weight of the previous value, 0 passes readings through"""
+        self._callback = callback
+        self._smoothing = min(max(smoothing, 0.0), 0.99)
+        self._precision = precision
+        self._raw = None  # type: typing.Optional[float]
+        self.value = None  # type: typing.Optional[float]
+
+    def feed(self, value: float):
+        if self._raw is not None and self._smoothing:
+            value = self._raw * self._smoothing + value * (1 - self._smoothing)
+        self._raw = value
+        value = round(value, self._precision)
+        if value != self.value:
+            self.value = value
+            self._callback(value)
+
+    def sensor_hook(self, device: Sensor):
+        if device.connected and device.temp != Sensor.UNINITIALIZED_VALUE:
+            self.feed(device.temp / _TEMP_SCALE)
@@ -1,4 +1,5 @@
 import struct
+import time
 import typing
 from typing import Optional
 
@@ -50,6 +51,7 @@ class Param(BaseBean):
         Param.cnt += 1
         BaseBean.__init__(self, Param.cnt, device_type, cmd_type)
         self._has_result = has_result
+        self._created = time.monotonic()
 
     def generate_subbody(self, s):
         return
@@ -75,6 +77,10 @@ class Param(BaseBean):
     def has_result(self):
         return self._has_result
 
+    @property
+    def created(self):
+        return self._created
+
 
 class HeartbeatParam(Param):
     def __init__(self):
@@ -205,6 +211,10 @@ class AirConControlParam(AirconParam):
         self._aircon = aircon
         self._new_status = new_status
 
+    @property
+    def device(self):
+        return self._aircon
+
     def generate_subbody(self, s):
         aircon = self._aircon
         status = self._new_status
@@ -0,0 +1,106 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+import typing
+from threading import Lock, Timer
+
+_LOGGER = logging.getLogger(__name__)
+
+_TOP = 40
+
+
+class Profiler:
+    """cProfile + tracemalloc around receive, decode and hook dispatch, for a limited window
+
+    cProfile only follows the thread that enables it, so the receive thread calls resume/pause
+    around each batch while a profile is running. A timer ends the window when no frames come in.
+    """
+    _profile = None  # type: typing.Optional[cProfile.Profile]
+    _locker = Lock()
+    _deadline = 0.0  # type: float
+    _path = ''  # type: str
+    _memory = False  # type: bool
+    _timer = None  # type: typing.Optional[Timer]
+
+    @staticmethod
+    def start(path: str, duration: float = 60, memory: bool = True) -> bool:
+        """path is the output file name without extension"""
+        with Profiler._locker:
+            if Profiler._profile is not None:
+                return False
+            Profiler._path = path
+            Profiler._deadline = time.monotonic() + duration
+            Profiler._memory = memory and not tracemalloc.is_tracing()
+            if Profiler._memory:
+                tracemalloc.start(10)
+            profile = Profiler._profile = cProfile.Profile()
+            Profiler._timer = Timer(duration, Profiler.stop, (profile,))
+            Profiler._timer.daemon = True
+            Profiler._timer.start()
+        _LOGGER.info('profiling for %ds', duration)
+        return True
+
+    @staticmethod
+    def is_running() -> bool:
+        return Profiler._profile is not None
+
+    @staticmethod
+    def resume() -> bool:
+        """the result goes to the matching pause(), True when this call holds the lock with the profile enabled"""
+        if Profiler._profile is None:
+            return False
+        Profiler._locker.acquire()
+        if Profiler._profile is None:
+            Profiler._locker.release()
+            return False
+        Profiler._profile.enable()
+        return True
+
+    @staticmethod
+    def pause(resumed: bool):
+        if not resumed:
+            return
+        Profiler._profile.disable()
+        Profiler._locker.release()
+        if time.monotonic() > Profiler._deadline:
+            Profiler.stop()
+
+    @staticmethod
+    def stop(only: cProfile.Profile = None) -> typing.Optional[str]:
+        """write the results and return the report path, None if nothing was running
+
+        with only, a profile started since is left running
+        """
+        with Profiler._locker:
+            profile = Profiler._profile
+            if profile is None or (only is not None and profile is not only):
+                return None
+            Profiler._profile = None
+            if Profiler._timer is not None:
+                Profiler._timer.cancel()
+                Profiler._timer = None
+            snapshot = None
+            if Profiler._memory:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+            path = Profiler._path
+        profile.dump_stats(path + '.prof')
+        out = io.StringIO()
+        try:
+            pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(_TOP)
+        except TypeError:
+            out.write('no samples collected\n')
+        if snapshot is not None:
+            here = os.path.dirname(os.path.abspath(__file__))
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(True, os.path.join(here, '*'))])
+            out.write('\ntop allocations in ds_air_service:\n')
+            for stat in snapshot.statistics('lineno')[:_TOP]:
+                out.write('%s\n' % stat)
+        with open(path + '.txt', 'w') as f:
+            f.write(out.getvalue())
+        _LOGGER.info('profile written to %s.txt', path)
+        return path + '.txt'
@@ -0,0 +1,262 @@
+"""one gateway connection shared by many clients
+
+The DTA117 accepts very few TCP clients. GatewayProxy keeps a single upstream connection and listens for
+any number of downstream clients: Home Assistant, the vendor app, the command line tools.
+
+- requests get a proxy wide cmd_id on their way up, replies carrying it go back to the client that asked,
+  with the client's own cmd_id restored; the route ends with the reply or after _ROUTE_TTL
+- room info and capability replies are kept and replayed to later clients asking the same, so discovery
+  of a new client does not reach the gateway
+- STATUS_CHANGED pushes and frames nobody asked for go to every client
+- heartbeats of clients are answered locally, the proxy sends its own upstream
+"""
+import asyncio
+import logging
+import struct
+import time
+import typing
+from collections import OrderedDict
+
+from .ctrl_enum import EnumDevice, EnumCmdType
+from .decoder import FrameReader
+
+_LOGGER = logging.getLogger(__name__)
+
+HEARTBEAT = b'\x02\x00\x00\x03'
+_CMD_ID = struct.Struct('<I')
+_CMD_ID_OFFSET = 7  # in the frame, after start byte, length and four reserved / version bytes
+_SUBBODY_OFFSET = 19
+_MAX_ROUTES = 4096
+_ROUTE_TTL = 30.0  # seconds, for requests the gateway answers with an ack only or not at all
+_MAX_CLIENT_BUFFER = 1 << 20
+
+# (dev_id, cmd_type) of requests whose replies only change with the installation
+_CACHEABLE = {(EnumDevice.SYSTEM.value[1], EnumCmdType.SYS_GET_ROOM_INFO.value),
+              (EnumDevice.SYSTEM.value[1], EnumCmdType.SYS_GET_ROOM_INFO_V1.value)}
+_CACHEABLE.update((i.value[1], EnumCmdType.AIR_CAPABILITY_QUERY.value) for i in (
+    EnumDevice.AIRCON, EnumDevice.NEWAIRCON, EnumDevice.BATHROOM, EnumDevice.VENTILATION, EnumDevice.GEOTHERMIC,
+    EnumDevice.HD))
+
+
+def with_cmd_id(frame: bytes, cmd_id: int, in_subbody: bool = False) -> bytes:
+    """frame with its header cmd_id, or the one a SYS_CMD_RSP subbody starts with, replaced"""
+    offset = _SUBBODY_OFFSET if in_subbody else _CMD_ID_OFFSET
+    return frame[:offset] + _CMD_ID.pack(cmd_id) + frame[offset + 4:]
+
+
+def _is_cmd_rsp(header) -> bool:
+    return header.dev_id == EnumDevice.SYSTEM.value[1] and header.cmd_type == EnumCmdType.SYS_CMD_RSP.value
+
+
+def _is_push(header) -> bool:
+    return header.dev_id != EnumDevice.SYSTEM.value[1] and header.cmd_type == EnumCmdType.STATUS_CHANGED.value
+
+
+class _Client:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.peer = writer.get_extra_info('peername')
+        self.closed = False
+
+    def write(self, data: bytes):
+        if self.closed:
+            return
+        if self.writer.transport.get_write_buffer_size() > _MAX_CLIENT_BUFFER:
+            # a client that stopped reading must not hold the others back
+            _LOGGER.warning('dropping client %s, it does not read', self.peer)
+            self.close()
+            return
+        self.writer.write(data)
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+
+class _Route:
+    __slots__ = ('client', 'cmd_id', 'dev_id', 'cmd_type', 'key', 'frames', 'created')
+
+    def __init__(self, client: _Client, cmd_id: int, header, key: typing.Optional[tuple]):
+        self.client = client
+        self.cmd_id = cmd_id
+        self.dev_id = header.dev_id
+        self.cmd_type = header.cmd_type
+        self.key = key  # cache key when the reply is worth keeping
+        self.frames = []  # type: typing.List[bytes]
+        self.created = time.monotonic()
+
+    def answered_by(self, header) -> bool:
+        return _is_cmd_rsp(header) or (header.dev_id == self.dev_id and header.cmd_type == self.cmd_type)
+
+
+class GatewayProxy:
+    def __init__(self, gateway_host: str, gateway_port: int, host: str = '0.0.0.0', port: int = 8008,
+                 cache_ttl: float = 600.0, heartbeat: float = 30.0):
+        self.gateway_host = gateway_host
+        self.gateway_port = gateway_port
+        self.host = host
+        self.port = port
+        self.cache_ttl = cache_ttl
+        self.heartbeat = heartbeat
+        self.forwarded = 0
+        self.routed = 0
+        self.broadcast = 0
+        self.cache_hits = 0
+        self.reconnects = 0
+        self._clients = set()  # type: typing.Set[_Client]
+        self._routes = OrderedDict()  # type: typing.OrderedDict[int, _Route]
+        self._cache = {}  # type: typing.Dict[tuple, typing.Tuple[float, typing.List[bytes]]]
+        self._cmd_id = 0
+        self._upstream = None  # type: typing.Optional[asyncio.StreamWriter]
+        self._connected = asyncio.Event()
+        self._server = None  # type: typing.Optional[asyncio.AbstractServer]
+        self._tasks = []  # type: typing.List[asyncio.Task]
+
+    async def start(self):
+        self._tasks.append(asyncio.ensure_future(self._upstream_loop()))
+        self._tasks.append(asyncio.ensure_future(self._heartbeat_loop()))
+        await self._connected.wait()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        _LOGGER.info('proxy for %s:%d listening on %s:%d', self.gateway_host, self.gateway_port, self.host,
+                     self.port)
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        for c in list(self._clients):
+            c.close()
+        if self._upstream is not None:
+            self._upstream.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def snapshot(self) -> dict:
+        return {
+            'clients': len(self._clients),
+            'connected': self._connected.is_set(),
+            'forwarded': self.forwarded,
+            'routed': self.routed,
+            'broadcast': self.broadcast,
+            'cache_hits': self.cache_hits,
+            'cached': len(self._cache),
+            'reconnects': self.reconnects
+        }
+
+    async def _upstream_loop(self):
+        while True:
+            try:
+                reader, self._upstream = await asyncio.open_connection(self.gateway_host, self.gateway_port)
+            except OSError as e:
+                _LOGGER.warning('cannot reach gateway %s:%d: %s', self.gateway_host, self.gateway_port, e)
+                await asyncio.sleep(3)
+                continue
+            _LOGGER.info('connected to gateway %s:%d', self.gateway_host, self.gateway_port)
+            self._connected.set()
+            frames = FrameReader(decode=False)
+            try:
+                while True:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                    frames.feed(data)
+                    for offset, header, _ in frames.frames():
+                        start = offset - frames.base
+                        self._from_gateway(frames.buffer[start:start + header.size], header)
+            except OSError as e:
+                # timeouts and unreachable hosts as well, the loop must always come back to reconnect
+                _LOGGER.warning('gateway connection lost: %s', e)
+            self._connected.clear()
+            self._upstream.close()
+            self._upstream = None
+            # replies still due will not come
+            self._routes.clear()
+            self.reconnects += 1
+            await asyncio.sleep(1)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            if self._upstream is not None:
+                self._upstream.write(HEARTBEAT)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Client(writer)
+        self._clients.add(client)
+        _LOGGER.info('client %s connected, %d now', client.peer, len(self._clients))
+        frames = FrameReader(decode=False)
+        try:
+            while not client.closed:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                frames.feed(data)
+                for offset, header, _ in frames.frames():
+                    start = offset - frames.base
+                    self._from_client(client, frames.buffer[start:start + header.size], header)
+                if self._upstream is not None:
+                    await self._upstream.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(client)
+            client.close()
+            _LOGGER.info('client %s disconnected, %d left', client.peer, len(self._clients))
+
+    def _from_client(self, client: _Client, frame: bytes, header):
+        if header.length == 0:
+            client.write(HEARTBEAT)
+            return
+        key = None
+        if (header.dev_id, header.cmd_type) in _CACHEABLE:
+            key = (header.dev_type, header.dev_id, header.cmd_type, frame[_SUBBODY_OFFSET:-1])
+            cached = self._cache.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+                self.cache_hits += 1
+                for i in cached[1]:
+                    client.write(with_cmd_id(i, header.cmd_id))
+                return
+        if self._upstream is None:
+            _LOGGER.debug('gateway not connected, dropping a request of %s', client.peer)
+            return
+        self._cmd_id = self._cmd_id + 1 & 0xffffffff
+        routes = self._routes
+        routes[self._cmd_id] = _Route(client, header.cmd_id, header, key)
+        expired = time.monotonic() - _ROUTE_TTL
+        while len(routes) > _MAX_ROUTES or next(iter(routes.values())).created < expired:
+            routes.popitem(last=False)
+        self.forwarded += 1
+        self._upstream.write(with_cmd_id(frame, self._cmd_id))
+
+    def _from_gateway(self, frame: bytes, header):
+        if header.length == 0:
+            return
+        cmd_rsp = _is_cmd_rsp(header)
+        route = None
+        if not _is_push(header):
+            if cmd_rsp:
+                # the header carries the gateway's own id, the request's is in the subbody
+                cmd_id = _CMD_ID.unpack_from(frame, _SUBBODY_OFFSET)[0] if len(frame) >= 24 else None
+            else:
+                cmd_id = header.cmd_id
+            route = self._routes.get(cmd_id)
+            if route is not None:
+                if time.monotonic() - route.created > _ROUTE_TTL:
+                    del self._routes[cmd_id]
+                    route = None
+                elif route.answered_by(header):
+                    del self._routes[cmd_id]
+        if route is None:
+            self.broadcast += 1
+            for c in list(self._clients):
+                c.write(frame)
+            return
+        frame = with_cmd_id(frame, route.cmd_id, cmd_rsp)
+        self.routed += 1
+        route.client.write(frame)
+        if route.key is not None and not cmd_rsp:
+            route.frames.append(frame)
+            if header.cmd_type == route.key[2] and header.dev_id == route.key[1]:
+                # the reply itself, after the ack if there was one
+                self._cache[route.key] = (time.monotonic(), route.frames)
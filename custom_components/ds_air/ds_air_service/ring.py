@@ -0,0 +1,57 @@
+import struct
+import time
+import typing
+
+DIRECTION_IN = 0
+DIRECTION_OUT = 1
+
+
+class FrameRing:
+    """fixed size history of raw frames, recording only stores references"""
+
+    def __init__(self, size: int = 512):
+        self._size = size
+        self._pos = 0
+        self._count = 0
+        self._ts = [0.0] * size  # type: typing.List[float]
+        self._direction = [0] * size  # type: typing.List[int]
+        self._data = [b''] * size  # type: typing.List[bytes]
+        self._start = [0] * size  # type: typing.List[int]
+        self._end = [0] * size  # type: typing.List[int]
+
+    def record(self, direction: int, data: bytes, start: int = 0, end: int = None):
+        """data[start:end] is the frame, the buffer is kept as is instead of being sliced"""
+        pos = self._pos
+        self._ts[pos] = time.time()
+        self._direction[pos] = direction
+        self._data[pos] = data
+        self._start[pos] = start
+        self._end[pos] = len(data) if end is None else end
+        self._pos = (pos + 1) % self._size
+        self._count += 1
+
+    def clear(self):
+        self._pos = 0
+        self._count = 0
+        for i in range(self._size):
+            self._data[i] = b''
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def count(self) -> int:
+        """frames recorded since creation, including the overwritten ones"""
+        return self._count
+
+    def frames(self) -> typing.List[typing.Tuple[float, int, int, bytes]]:
+        """(timestamp, direction, cmd_id, frame) from oldest to newest"""
+        res = []
+        n = min(self._count, self._size)
+        for i in range(self._pos - n, self._pos):
+            i %= self._size
+            frame = self._data[i][self._start[i]:self._end[i]]
+            cmd_id = struct.unpack_from('<I', frame, 7)[0] if len(frame) >= 11 else 0
+            res.append((self._ts[i], self._direction[i], cmd_id, frame))
+        return res
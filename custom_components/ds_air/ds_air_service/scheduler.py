@@ -0,0 +1,152 @@
+"""outbound frames by priority, fair between devices and paced for the gateway
+
+The gateway handles a handful of frames per second at best, a poll cycle of a large installation or a
+discovery would otherwise sit in its buffers ahead of a command the user is waiting for. Every frame goes
+through OutboundScheduler: the writer thread sends the waiting frame of the highest priority first, takes
+devices of the same priority in turn and holds frames back while the token bucket is empty. Whatever is
+waiting when the writer wakes, up to max_batch frames, goes out in a single write.
+"""
+import logging
+import time
+import typing
+from collections import OrderedDict, deque
+from threading import Thread, Condition
+
+from .param import Param, HeartbeatParam, AirConControlParam
+from .stats import Stats
+from .trace import Tracer
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_CONTROL = 0  # commands of the user and heartbeats
+PRIORITY_CONFIRM = 1  # queries whose answer someone is waiting for
+PRIORITY_DISCOVERY = 2  # handshake, rooms, capabilities and the first status of each unit
+PRIORITY_POLL = 3  # periodic status and sensor polls
+_PRIORITIES = (PRIORITY_CONTROL, PRIORITY_CONFIRM, PRIORITY_DISCOVERY, PRIORITY_POLL)
+
+DEFAULT_RATE = 20.0  # frames per second, 0 for no limit
+DEFAULT_BURST = 40  # frames sent back to back before the rate applies
+DEFAULT_MAX_BATCH = 32  # frames written with one system call
+
+
+def default_priority(p: Param, ready: bool) -> int:
+    if isinstance(p, (HeartbeatParam, AirConControlParam)):
+        return PRIORITY_CONTROL
+    return PRIORITY_POLL if ready else PRIORITY_DISCOVERY
+
+
+def _device_key(p: Param) -> str:
+    device = getattr(p, 'device', None)
+    return device.unique_id if device is not None else p.target.name
+
+
+class TokenBucket:
+    """rate tokens a second up to burst, a batch may take more than there are and is paid back later"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+
+    def delay(self) -> float:
+        """seconds until the next frame may go, 0 now"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def available(self) -> float:
+        return self._tokens if self.rate > 0 else float('inf')
+
+    def take(self, n: int):
+        if self.rate > 0:
+            self._tokens -= n
+
+
+class OutboundScheduler(Thread):
+    """writer thread of a client with send_many, SocketClient or ReplayClient"""
+
+    def __init__(self, client, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 max_batch: int = DEFAULT_MAX_BATCH):
+        super().__init__(name='ds_air_writer')
+        self.daemon = True
+        self._client = client
+        self._bucket = TokenBucket(rate, burst)
+        self._max_batch = max(1, max_batch)
+        self._cond = Condition()
+        # per priority: device key -> batches, the first key is the next device served
+        self._queues = [OrderedDict() for _ in _PRIORITIES]  # type: typing.List[typing.OrderedDict[str, deque]]
+        self._pending = 0
+        self._running = True
+
+    def submit(self, params: typing.List[Param], priority: int):
+        """queue frames to be written together, in order, when their turn comes"""
+        for p in params:
+            Tracer.enqueued(p)
+        Stats.send_queue(len(params))
+        with self._cond:
+            queue = self._queues[priority]
+            key = _device_key(params[0])
+            batches = queue.get(key)
+            if batches is None:
+                batches = queue[key] = deque()
+            batches.append(params)
+            self._pending += 1
+            self._cond.notify()
+
+    def terminate(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _pop(self, queue: typing.OrderedDict[str, deque]) -> typing.List[Param]:
+        key, batches = next(iter(queue.items()))
+        params = batches.popleft()
+        # the device goes to the back of its priority, its next frame waits for the others
+        del queue[key]
+        if batches:
+            queue[key] = batches
+        self._pending -= 1
+        return params
+
+    def _pop_batch(self, tokens: float) -> typing.List[Param]:
+        """waiting frames in turn up to max_batch, all but user commands only while tokens last"""
+        batch = []
+        control = self._queues[PRIORITY_CONTROL]
+        while len(batch) < self._max_batch:
+            queue = next((q for q in self._queues if q), None)
+            if queue is None or (queue is not control and len(batch) + 1 > tokens):
+                break
+            batch.extend(self._pop(queue))
+        return batch
+
+    def run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                # user commands only take tokens, they never wait for them
+                urgent = bool(self._queues[PRIORITY_CONTROL])
+            delay = 0.0 if urgent else self._bucket.delay()
+            if delay > 0:
+                Stats.throttled()
+                # the frame to send is picked afterwards, anything more urgent queued meanwhile goes first
+                time.sleep(delay)
+                continue
+            with self._cond:
+                params = self._pop_batch(self._bucket.available())
+            if not params:
+                continue
+            self._bucket.take(len(params))
+            Stats.send_queue(-len(params))
+            try:
+                self._client.send_many(params)
+            except Exception as e:
+                _LOGGER.warning('send error: %s', e)
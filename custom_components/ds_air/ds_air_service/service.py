@@ -2,29 +2,85 @@ import logging
 import socket
 import time
 import typing
-from threading import Thread, Lock
+from threading import Thread, Lock, Event
 
+from .capture import CaptureWriter, ReplayClient
 from .ctrl_enum import EnumDevice
 from .dao import Room, AirCon, AirConStatus, get_device_by_aircon, Sensor
-from .decoder import decoder, BaseResult
+from .decoder import BaseResult, FrameReader
+from .dedupe import Dedupe
 from .display import display
-from .param import Param, HandShakeParam, HeartbeatParam, AirConControlParam, AirConQueryStatusParam, Sensor2InfoParam
+from .param import Param, HandShakeParam, HeartbeatParam, AirConControlParam, AirConQueryStatusParam, \
+    Sensor2InfoParam, GetRoomInfoParam
+from .profiler import Profiler
+from .link import TemperatureLink
+from .ring import FrameRing, DIRECTION_IN, DIRECTION_OUT
+from .scheduler import OutboundScheduler, default_priority, DEFAULT_RATE, DEFAULT_BURST, DEFAULT_MAX_BATCH, \
+    PRIORITY_CONTROL, PRIORITY_DISCOVERY, PRIORITY_POLL
+from .stats import Stats
+from .trace import Tracer
+from . import snapshot
 
 _LOGGER = logging.getLogger(__name__)
 
 
+HEARTBEAT_INTERVAL = 60.0  # seconds without any frame from the gateway before a heartbeat is sent
+HEARTBEAT_TIMEOUT = 5.0  # seconds at least to wait for its reply, more on a slow link
+HEARTBEAT_MISSED = 3  # heartbeats in a row without a reply before reconnecting
+
+# the kernel gives up on a peer that stopped answering well before the default two hours
+_IOV_MAX = 1024  # buffers a single sendmsg takes on linux
+_KEEPALIVE = (('TCP_KEEPIDLE', 60), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3), ('TCP_USER_TIMEOUT', 60000))
+
+
 def _log(s: str):
     s = str(s)
     for i in s.split('\n'):
         _LOGGER.debug(i)
 
 
+def _sendmsg_all(s: socket.socket, frames: typing.List[bytes]) -> int:
+    """write frames with scatter gather, without joining them first, returns the system calls made"""
+    if len(frames) == 1 or not hasattr(s, 'sendmsg'):
+        s.sendall(frames[0] if len(frames) == 1 else b''.join(frames))
+        return 1
+    views = [memoryview(i) for i in frames]
+    calls = 0
+    while views:
+        n = s.sendmsg(views[:_IOV_MAX])
+        calls += 1
+        # a partial write leaves the rest of the buffers for the next call
+        while n:
+            if n >= len(views[0]):
+                n -= len(views.pop(0))
+            else:
+                views[0] = views[0][n:]
+                n = 0
+    return calls
+
+
+def _set_keepalive(s: socket.socket):
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for name, value in _KEEPALIVE:
+        opt = getattr(socket, name, None)  # linux only, some are missing elsewhere
+        if opt is not None:
+            try:
+                s.setsockopt(socket.IPPROTO_TCP, opt, value)
+            except OSError:
+                pass
+
+
 class SocketClient:
     def __init__(self, host: str, port: int):
         self._host = host
         self._port = port
         self._locker = Lock()
         self._s = None
+        self._frames = FrameRing()
+        self._quarantine = FrameRing(64)
+        self._reader = FrameReader(self._quarantine, dedupe=True)
+        self._capture = None  # type: typing.Optional[CaptureWriter]
+        self.last_recv = time.monotonic()  # type: float
         while not self.do_connect():
             time.sleep(3)
         self._ready = True
@@ -34,33 +90,99 @@ class SocketClient:
     def destroy(self):
         self._ready = False
         self._recv_thread.terminate()
+        # close alone does not wake a recv blocked in the receive thread
+        self._wake_recv(self._s)
         self._s.close()
+        self.stop_capture()
 
     def do_connect(self):
-        self._s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # the socket is only replaced once connected, the other threads keep failing on the old one meanwhile
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            self._s.connect((self._host, self._port))
-            _log('connected')
-            return True
+            _set_keepalive(s)
+            s.connect((self._host, self._port))
         except socket.error as exc:
+            s.close()
             _log('connected error')
             _log(str(exc))
             return False
+        old, self._s = self._s, s
+        if old is not None:
+            old.close()
+        self.last_recv = time.monotonic()
+        _log('connected')
+        return True
+
+    def reconnect(self):
+        """drop a connection the gateway stopped answering on"""
+        _LOGGER.warning('gateway %s:%d does not answer, reconnecting', self._host, self._port)
+        self._wake_recv(self._s)
+
+    @staticmethod
+    def _wake_recv(s: socket.socket):
+        # the receive thread sees the connection end and makes a new one, it is the only one connecting
+        try:
+            s.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
 
     def send(self, p: Param):
+        self.send_many([p])
+
+    def send_many(self, params: typing.List[Param]):
+        """all frames in one write, the gateway answers them in turn
+
+        a write interrupted by a lost connection is sent again whole on the new one
+        """
         self._locker.acquire()
-        _log('\033[31msend:\033[0m')
-        _log(display(p))
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            for p in params:
+                _log('\033[31msend:\033[0m')
+                _log(display(p))
         done = False
+        frames = [p.to_string() for p in params]
         while not done:
+            s = self._s
             try:
-                self._s.sendall(p.to_string())
+                Stats.written(len(frames), _sendmsg_all(s, frames))
                 done = True
             except Exception:
+                if not self._ready:
+                    self._locker.release()
+                    return
+                self._wake_recv(s)
                 time.sleep(3)
-                self.do_connect()
+        for p, frame in zip(params, frames):
+            Tracer.written(p)
+            Stats.frame_out(p.cmd_type.value, len(frame))
+            self._frames.record(DIRECTION_OUT, frame)
+            if self._capture is not None:
+                self._capture.write(DIRECTION_OUT, frame)
         self._locker.release()
 
+    @property
+    def frames(self) -> FrameRing:
+        return self._frames
+
+    @property
+    def quarantine(self) -> FrameRing:
+        """malformed frames and garbage skipped by the reader"""
+        return self._quarantine
+
+    def start_capture(self, path: str) -> bool:
+        if self._capture is not None:
+            return False
+        self._capture = CaptureWriter(path)
+        return True
+
+    def stop_capture(self) -> typing.Optional[str]:
+        capture = self._capture
+        if capture is None:
+            return None
+        self._capture = None
+        capture.close()
+        return capture.path
+
     def recv(self) -> (typing.List[BaseResult], bytes):
         res = []
         done = False
@@ -69,18 +191,37 @@ class SocketClient:
         while not done:
             try:
                 data = self._s.recv(1024)
+                if not data:
+                    raise ConnectionError('closed by the gateway')
                 done = True
             except Exception:
                 if not self._ready:
                     return [], None
                 time.sleep(3)
-                self.do_connect()
-        d = data
-        while data:
-            r, b = decoder(data)
-            res.append(r)
-            data = b
-        return res, d
+                if self.do_connect():
+                    Stats.reconnected()
+        self.last_recv = time.monotonic()
+        self._reader.feed(data)
+        d = self._reader.buffer
+        base = self._reader.base
+        first = last = None
+        resumed = Profiler.resume()
+        try:
+            # frames larger than one recv stay in the reader until the next one completes them
+            for offset, header, r in self._reader.frames():
+                pos = offset - base
+                end = pos + header.size
+                if first is None:
+                    first = pos
+                last = end
+                res.append(r)
+                self._frames.record(DIRECTION_IN, d, pos, end)
+                if self._capture is not None:
+                    self._capture.write(DIRECTION_IN, d, pos, end)
+                Stats.frame_in(header.cmd_type, header.size)
+        finally:
+            Profiler.pause(resumed)
+        return res, d[first:last] if first is not None else None
 
 
 class RecvThread(Thread):
@@ -95,42 +236,106 @@ class RecvThread(Thread):
 
     def run(self) -> None:
         while self._running:
-            res, data = self._sock.recv()
-            if data is not None:
+            try:
+                res, data = self._sock.recv()
+            except Exception as e:
+                # bad input must never end the receive loop
+                _LOGGER.warning('recv error: %s', e)
+                time.sleep(1)
+                continue
+            # formatting is skipped unless debug logging is on, display would also decode lazy results
+            debug = _LOGGER.isEnabledFor(logging.DEBUG)
+            if data is not None and debug:
                 _log("hex: 0x"+data.hex())
-            for i in res:
-                _log('\033[31mrecv:\033[0m')
-                _log(display(i))
-                self._locker.acquire()
-                i.do()
-                self._locker.release()
+            Stats.recv_queue(len(res))
+            resumed = Profiler.resume()
+            try:
+                for i in res:
+                    if debug:
+                        _log('\033[31mrecv:\033[0m')
+                        _log(display(i))
+                    with self._locker:
+                        start = time.perf_counter()
+                        try:
+                            i.do()
+                            if Service.has_frame_hooks():
+                                Service.notify_frame(i)
+                        except Exception as e:
+                            Stats.dispatch_failed()
+                            _log('dispatch error!!')
+                            _log(str(e))
+                        Stats.dispatched(time.perf_counter() - start)
+            finally:
+                Profiler.pause(resumed)
 
 
 class HeartBeatThread(Thread):
+    """keeps the connection alive and runs the periodic polls
+
+    any frame from the gateway proves the link is up, heartbeats only go out after HEARTBEAT_INTERVAL
+    of silence. Once the gateway has answered one, HEARTBEAT_MISSED unanswered in a row mean the peer is
+    gone, a half open connection after a router reboot for instance, and the connection is made again.
+    """
+
     def __init__(self):
         super().__init__()
         self._running = True
+        self._wakeup = Event()
 
     def terminate(self):
         self._running = False
+        self._wakeup.set()
 
     def run(self) -> None:
         super().run()
-        time.sleep(30)
-        cnt = 0
+        now = time.monotonic()
+        next_poll = now + Service.get_scan_interval() * 60
+        next_topology = now + Service.get_topology_interval() * 60
+        sent = 0.0
+        missed = 0
         while self._running:
-            Service.send_msg(HeartbeatParam())
-            cnt += 1
-            if cnt == Service.get_scan_interval():
+            client = Service.get_client()
+            if client is None:
+                break
+            now = time.monotonic()
+            last = client.last_recv
+            if sent and last >= sent:
+                sent = 0.0
+                missed = 0
+            # a slow link gets more time, the average round trip is 0 until a heartbeat was answered
+            timeout = max(HEARTBEAT_TIMEOUT, Stats.heartbeat_rtt.avg * 4)
+            if sent and now - sent >= timeout:
+                sent = 0.0
+                Stats.heartbeat_missed()
+                # a gateway that never answers heartbeats is left alone
+                if Stats.heartbeat_rtt.count:
+                    missed += 1
+                    if missed >= HEARTBEAT_MISSED:
+                        missed = 0
+                        client.reconnect()
+                        # the receive thread connects again meanwhile, which counts as traffic
+                        self._wakeup.wait(HEARTBEAT_TIMEOUT * 2)
+                        continue
+            if not sent and now - last >= HEARTBEAT_INTERVAL:
+                Service.send_msg(HeartbeatParam())
+                Stats.heartbeat_sent()
+                sent = now
+            if now >= next_poll:
                 _log("poll_status")
-                cnt = 0
+                next_poll = now + Service.get_scan_interval() * 60
                 Service.poll_status()
+            if now >= next_topology:
+                _log("refresh_topology")
+                next_topology = now + Service.get_topology_interval() * 60
+                Service.refresh_topology()
 
-            time.sleep(60)
+            due = sent + timeout if sent else last + HEARTBEAT_INTERVAL
+            self._wakeup.wait(max(0.1, min(due, next_poll, next_topology) - now))
 
 
 class Service:
     _socket_client = None  # type: SocketClient
+    _scheduler = None  # type: OutboundScheduler
     _rooms = None  # type: typing.List[Room]
     _aircons = None  # type: typing.List[AirCon]
     _new_aircons = None  # type: typing.List[AirCon]
@@ -138,47 +343,74 @@ class Service:
     _ready = False  # type: bool
     _none_stat_dev_cnt = 0  # type: int
     _status_hook = []  # type: typing.List[(AirCon, typing.Callable)]
-    _sensor_hook = []  # type: typing.List[(str, typing.Callable)]
+    _sensor_hook = {}  # type: typing.Dict[str, typing.List[typing.Callable]]
+    _frame_hook = []  # type: typing.List[(typing.Optional[EnumDevice], typing.Optional[int], typing.Callable)]
+    _topology_hook = []  # type: typing.List[typing.Callable]
+    _topology_queries = set()  # type: typing.Set[int]
+    _pending_aircons = []  # type: typing.List[AirCon]
     _heartbeat_thread = None
+    _discovered = Event()
     _sensors = []  # type: typing.List[Sensor]
     _scan_interval = 5  # type: int
+    _topology_interval = 60  # type: int
+    _ack_waiters = {}  # type: typing.Dict[int, typing.List]
+    _live = set()  # type: typing.Set[str]
+    _stale = {}  # type: typing.Dict[str, float]
 
     @staticmethod
-    def init(host: str, port: int, scan_interval: int):
+    def init(host: str, port: int, scan_interval: int, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+             max_batch: int = DEFAULT_MAX_BATCH):
+        """rate and burst limit the frames per second written to the gateway, rate 0 for no limit
+
+        up to max_batch frames waiting together are written with one system call
+        """
         if Service._ready:
             return
+        Service._start(SocketClient(host, port), scan_interval, rate=rate, burst=burst, max_batch=max_batch)
+
+    @staticmethod
+    def replay(path: str, speed: float = 1.0, scan_interval: int = 5):
+        """run on a recorded capture instead of a gateway, see capture.ReplayClient"""
+        if Service._ready:
+            return
+        client = ReplayClient(path, speed)
+        Service._start(client, scan_interval, client.finished, rate=0)
+
+    @staticmethod
+    def _start(client, scan_interval: int, finished: Event = None, rate: float = DEFAULT_RATE,
+               burst: int = DEFAULT_BURST, max_batch: int = DEFAULT_MAX_BATCH):
         Service._scan_interval = scan_interval
-        Service._socket_client = SocketClient(host, port)
-        Service._socket_client.send(HandShakeParam())
+        Stats.reset()
+        Tracer.reset()
+        Service._socket_client = client
+        Service._scheduler = OutboundScheduler(client, rate, burst, max_batch)
+        Service._scheduler.start()
+        Service.send_msg(HandShakeParam(), PRIORITY_DISCOVERY)
         Service._heartbeat_thread = HeartBeatThread()
         Service._heartbeat_thread.start()
-        while Service._rooms is None or Service._aircons is None \
-                or Service._new_aircons is None or Service._bathrooms is None:
-            time.sleep(1)
-        for i in Service._aircons:
-            for j in Service._rooms:
-                if i.room_id == j.id:
-                    i.alias = j.alias
-                    if i.unit_id:
-                        i.alias += str(i.unit_id)
-        for i in Service._new_aircons:
-            for j in Service._rooms:
-                if i.room_id == j.id:
-                    i.alias = j.alias
-                    if i.unit_id:
-                        i.alias += str(i.unit_id)
-        for i in Service._bathrooms:
-            for j in Service._rooms:
-                if i.room_id == j.id:
-                    i.alias = j.alias
-                    if i.unit_id:
-                        i.alias += str(i.unit_id)
+        while not Service._discovered.wait(1):
+            if finished is not None and finished.is_set() and not Service._discovered.is_set():
+                # a replayed capture that ends before discovery completes
+                Service._heartbeat_thread.terminate()
+                Service._scheduler.terminate()
+                Service._scheduler = None
+                client.destroy()
+                Service._socket_client = None
+                raise ValueError('capture ended before discovery completed')
+        for i in Service.get_aircons():
+            Service._set_alias(i)
         Service._ready = True
+        # from now on unchanged poll answers are dropped before decoding, frame hooks want to see them all
+        Dedupe.clear()
+        Dedupe.enabled = not Service._frame_hook
 
     @staticmethod
     def destroy():
         if Service._ready:
             Service._heartbeat_thread.terminate()
+            # frames still waiting are dropped with the connection
+            Service._scheduler.terminate()
+            Service._scheduler = None
             Service._socket_client.destroy()
             Service._socket_client = None
             Service._rooms = None
@@ -187,9 +419,19 @@ class Service:
             Service._bathrooms = None
             Service._none_stat_dev_cnt = 0
             Service._status_hook = []
-            Service._sensor_hook = []
+            Service._sensor_hook = {}
+            Service._frame_hook = []
+            BaseResult.unsubscribe_all()
+            Dedupe.enabled = False
+            Dedupe.clear()
+            Service._topology_hook = []
+            Service._topology_queries = set()
+            Service._pending_aircons = []
             Service._heartbeat_thread = None
+            Service._discovered.clear()
             Service._sensors = []
+            Service._live = set()
+            Service._stale = {}
             Service._ready = False
 
     @staticmethod
@@ -199,15 +441,154 @@ class Service:
     @staticmethod
     def control(aircon: AirCon, status: AirConStatus):
         p = AirConControlParam(aircon, status)
+        Dedupe.invalidate(get_device_by_aircon(aircon), aircon.room_id, aircon.unit_id)
         Service.send_msg(p)
 
+    @staticmethod
+    def control_many(items: typing.List[typing.Tuple[AirCon, AirConStatus]], timeout: float = 5.0) \
+            -> typing.List[dict]:
+        """control several units with a single write and wait for their acks together
+
+        returns one dict per item, in order: unit, cmd_id, acked and ack_ms, code when the gateway sent one
+        """
+        if not items:
+            return []
+        params = []
+        waiters = []
+        for aircon, status in items:
+            p = AirConControlParam(aircon, status)
+            Dedupe.invalidate(get_device_by_aircon(aircon), aircon.room_id, aircon.unit_id)
+            params.append(p)
+            # event, ack time, code
+            waiters.append(Service._ack_waiters.setdefault(p.cmd_id, [Event(), 0.0, None]))
+        start = time.monotonic()
+        try:
+            Service._scheduler.submit(params, PRIORITY_CONTROL)
+            deadline = start + timeout
+            res = []
+            for (aircon, _), p, w in zip(items, params, waiters):
+                acked = w[0].wait(max(0.0, deadline - time.monotonic()))
+                r = {'unit': aircon.unique_id, 'cmd_id': p.cmd_id, 'acked': acked,
+                     'ack_ms': round((w[1] - start) * 1000, 3) if acked else None}
+                if w[2] is not None:
+                    r['code'] = w[2]
+                res.append(r)
+            return res
+        finally:
+            for p in params:
+                Service._ack_waiters.pop(p.cmd_id, None)
+
+    @staticmethod
+    def restore_snapshot(path: str) -> int:
+        """give units and sensors nothing was heard from yet their state saved by save_snapshot
+
+        they are stale until the gateway reports on them, returns how many were restored
+        """
+        res = snapshot.read(path)
+        if res is None:
+            return 0
+        saved_at, statuses, readings = res
+        restored = 0
+        for i in Service.get_aircons():
+            status = statuses.get(i.unique_id)
+            if status is not None and i.unique_id not in Service._live:
+                i.status = status
+                Service._stale[i.unique_id] = saved_at
+                restored += 1
+        for i in Service._sensors:
+            values = readings.get(i.unique_id)
+            if values is not None and i.unique_id not in Service._live:
+                for k, v in values.items():
+                    setattr(i, k, v)
+                Service._stale[i.unique_id] = saved_at
+                restored += 1
+        _log('restored %d devices from %s' % (restored, path))
+        return restored
+
+    @staticmethod
+    def save_snapshot(path: str):
+        if not Service._ready:
+            return
+        # units restored and never heard from again keep the state they were saved with
+        snapshot.save(path, Service.get_aircons(), Service._sensors)
+
+    @staticmethod
+    def get_stale_since(unique_id: str) -> typing.Optional[float]:
+        """unix time the state of a restored device was saved, None once the gateway reported on it"""
+        return Service._stale.get(unique_id)
+
+    @staticmethod
+    def _mark_live(unique_id: str):
+        Service._live.add(unique_id)
+        if Service._stale:
+            Service._stale.pop(unique_id, None)
+
+    @staticmethod
+    def acked(cmd_id: int, code: int = None):
+        w = Service._ack_waiters.get(cmd_id)
+        if w is not None:
+            w[1] = time.monotonic()
+            w[2] = code
+            w[0].set()
+
     @staticmethod
     def register_status_hook(device: AirCon, hook: typing.Callable):
         Service._status_hook.append((device, hook))
+        # answers that came before the hook were only remembered, the next one must reach it
+        Dedupe.invalidate(get_device_by_aircon(device), device.room_id, device.unit_id)
 
     @staticmethod
     def register_sensor_hook(unique_id: str, hook: typing.Callable):
-        Service._sensor_hook.append((unique_id, hook))
+        Service._sensor_hook.setdefault(unique_id, []).append(hook)
+        # as for units, the next sensor info must reach the new hook even if nothing changed
+        Dedupe.invalidate_sensors()
+
+    @staticmethod
+    def link_sensor(unique_id: str, link: TemperatureLink) -> bool:
+        """feed link from the sensor of unique_id, with its current reading first, False if there is none"""
+        for i in Service._sensors:
+            if i.unique_id == unique_id:
+                Service.register_sensor_hook(unique_id, link.sensor_hook)
+                link.sensor_hook(i)
+                return True
+        return False
+
+    @staticmethod
+    def register_frame_hook(hook: typing.Callable, target: EnumDevice = None, cmd_type: int = None):
+        """hook(result) for every received frame of target and cmd_type, None matches any
+
+        results are normally decoded only when something reads them, subscribed ones are decoded eagerly
+        """
+        Service._frame_hook.append((target, cmd_type, hook))
+        BaseResult.subscribe(target, cmd_type)
+        Dedupe.enabled = False
+
+    @staticmethod
+    def register_topology_hook(hook: typing.Callable):
+        """hook(added, removed) is called with the devices found or lost by refresh_topology"""
+        Service._topology_hook.append(hook)
+
+    @staticmethod
+    def refresh_topology():
+        """rediscover rooms and units, the result is diffed against the known devices"""
+        if not Service._ready:
+            return
+        p = GetRoomInfoParam()
+        p.room_ids.append(0xffff)
+        Service.send_msg(p, PRIORITY_DISCOVERY)
+
+    @staticmethod
+    def start_capture(path: str) -> bool:
+        """record every frame sent and received to path, False if not connected or already recording"""
+        if not isinstance(Service._socket_client, SocketClient):
+            return False
+        return Service._socket_client.start_capture(path)
+
+    @staticmethod
+    def stop_capture() -> typing.Optional[str]:
+        if not isinstance(Service._socket_client, SocketClient):
+            return None
+        return Service._socket_client.stop_capture()
 
     # ----split line---- above for component, below for inner call
 
@@ -216,9 +597,26 @@ class Service:
         return Service._ready
 
     @staticmethod
-    def send_msg(p: Param):
-        """send msg to climate gateway"""
-        Service._socket_client.send(p)
+    def send_msg(p: Param, priority: int = None):
+        """send msg to climate gateway, see scheduler for the priorities, the default follows the param"""
+        if priority is None:
+            priority = default_priority(p, Service._ready)
+        Service._scheduler.submit([p], priority)
+
+    @staticmethod
+    def get_client():
+        """the SocketClient, or ReplayClient when replaying, None when stopped"""
+        return Service._socket_client
+
+    @staticmethod
+    def get_frames() -> typing.Optional[FrameRing]:
+        if Service._socket_client is None:
+            return None
+        return Service._socket_client.frames
+
+    @staticmethod
+    def get_quarantine() -> typing.Optional[FrameRing]:
+        return getattr(Service._socket_client, 'quarantine', None)
 
     @staticmethod
     def get_rooms():
@@ -237,8 +635,90 @@ class Service:
         Service._sensors = sensors
 
     @staticmethod
-    def set_device(t: EnumDevice, v: typing.List[AirCon]):
-        Service._none_stat_dev_cnt += len(v)
+    def update_rooms(rooms: typing.List[Room], sensors: typing.List[Sensor]):
+        """rooms and sensors rediscovered after init, keep the sensor objects we already know"""
+        Service._rooms = rooms
+        old = {}
+        for i in Service._sensors:
+            old[i.unique_id] = i
+        new = [old.get(i.unique_id, i) for i in sensors]
+        ids = set(i.unique_id for i in new)
+        added = [i for i in new if i.unique_id not in old]
+        removed = [i for i in Service._sensors if i.unique_id not in ids]
+        Service._sensors = new
+        if removed:
+            Service._sensor_hook = {k: v for k, v in Service._sensor_hook.items() if k in ids}
+        Service._topology_changed(added, removed)
+
+    @staticmethod
+    def expect_topology(p: Param):
+        Service._topology_queries.add(p.cmd_id)
+
+    @staticmethod
+    def is_topology_result(cmd_id: int) -> bool:
+        if cmd_id in Service._topology_queries:
+            Service._topology_queries.discard(cmd_id)
+            return True
+        return False
+
+    @staticmethod
+    def merge_aircons(target: EnumDevice, aircons: typing.List[AirCon]):
+        """diff a rediscovered device list, new units are announced once their status arrives"""
+        old = Service._get_device_list(target)
+        new_keys = set((i.room_id, i.unit_id) for i in aircons)
+        Service._pending_aircons = [i for i in Service._pending_aircons if get_device_by_aircon(i) != target
+                                    or (i.room_id, i.unit_id) in new_keys]
+        old_keys = set((i.room_id, i.unit_id) for i in old + Service._pending_aircons
+                       if get_device_by_aircon(i) == target)
+        removed = [i for i in old if (i.room_id, i.unit_id) not in new_keys]
+        for i in aircons:
+            if (i.room_id, i.unit_id) not in old_keys:
+                # a unit that comes back may answer exactly like before it left
+                Dedupe.invalidate(target, i.room_id, i.unit_id)
+                Service._set_alias(i)
+                Service._pending_aircons.append(i)
+                p = AirConQueryStatusParam()
+                p.target = target
+                p.device = i
+                Service.send_msg(p, PRIORITY_DISCOVERY)
+        if removed:
+            Service._set_device_list(target, [i for i in old if (i.room_id, i.unit_id) in new_keys])
+            Service._status_hook = [i for i in Service._status_hook
+                                    if get_device_by_aircon(i[0]) != target
+                                    or (i[0].room_id, i[0].unit_id) in new_keys]
+            Service._topology_changed([], removed)
+
+    @staticmethod
+    def _topology_changed(added: typing.List, removed: typing.List):
+        if not added and not removed:
+            return
+        _log('topology changed: %d added, %d removed' % (len(added), len(removed)))
+        for func in Service._topology_hook:
+            try:
+                func(added, removed)
+            except Exception as e:
+                _log('topology hook error!!')
+                _log(str(e))
+
+    @staticmethod
+    def _set_alias(aircon: AirCon):
+        for j in Service._rooms:
+            if aircon.room_id == j.id:
+                aircon.alias = j.alias
+                if aircon.unit_id:
+                    aircon.alias += str(aircon.unit_id)
+
+    @staticmethod
+    def _get_device_list(t: EnumDevice) -> typing.List[AirCon]:
+        if t == EnumDevice.AIRCON:
+            return Service._aircons
+        elif t == EnumDevice.NEWAIRCON:
+            return Service._new_aircons
+        else:
+            return Service._bathrooms
+
+    @staticmethod
+    def _set_device_list(t: EnumDevice, v: typing.List[AirCon]):
         if t == EnumDevice.AIRCON:
             Service._aircons = v
         elif t == EnumDevice.NEWAIRCON:
@@ -246,9 +726,25 @@ class Service:
         else:
             Service._bathrooms = v
 
+    @staticmethod
+    def set_device(t: EnumDevice, v: typing.List[AirCon]):
+        Service._none_stat_dev_cnt += len(v)
+        Service._set_device_list(t, v)
+        if Service._rooms is not None and Service._aircons is not None \
+                and Service._new_aircons is not None and Service._bathrooms is not None:
+            Service._discovered.set()
+
     @staticmethod
     def set_aircon_status(target: EnumDevice, room: int, unit: int, status: AirConStatus):
         if Service._ready:
+            for i in Service._pending_aircons:
+                if i.unit_id == unit and i.room_id == room and get_device_by_aircon(i) == target:
+                    i.status = status
+                    Service._mark_live(i.unique_id)
+                    Service._pending_aircons.remove(i)
+                    Service._set_device_list(target, Service._get_device_list(target) + [i])
+                    Service._topology_changed([i], [])
+                    return
             Service.update_aircon(target, room, unit, status=status)
         else:
             li = []
@@ -261,24 +757,39 @@ class Service:
             for i in li:
                 if i.unit_id == unit and i.room_id == room:
                     i.status = status
+                    Service._mark_live(i.unique_id)
                     Service._none_stat_dev_cnt -= 1
                     break
 
+    @staticmethod
+    def has_frame_hooks() -> bool:
+        return bool(Service._frame_hook)
+
+    @staticmethod
+    def notify_frame(result: BaseResult):
+        cmd_type = getattr(result.cmd_type, 'value', result.cmd_type)
+        for target, t, func in Service._frame_hook:
+            if (target is None or target == result.target) and (t is None or t == cmd_type):
+                try:
+                    func(result)
+                except Exception as e:
+                    _log('frame hook error!!')
+                    _log(str(e))
+
     @staticmethod
     def set_sensors_status(sensors: typing.List[Sensor]):
         for newSensor in sensors:
+            Service._mark_live(newSensor.unique_id)
             for sensor in Service._sensors:
                 if sensor.name == newSensor.name or sensor.alias == newSensor.alias:
                     for attr in Sensor.STATUS_ATTR:
                         setattr(sensor, attr, getattr(newSensor, attr))
                     break
-            for item in Service._sensor_hook:
-                unique_id, func = item
-                if newSensor.unique_id == unique_id:
-                    try:
-                        func(newSensor)
-                    except Exception as e:
-                        _log(str(e))
+            for func in Service._sensor_hook.get(newSensor.unique_id, ()):
+                try:
+                    func(newSensor)
+                except Exception as e:
+                    _log(str(e))
 
     @staticmethod
     def poll_status():
@@ -286,9 +797,9 @@ class Service:
             p = AirConQueryStatusParam()
             p.target = EnumDevice.NEWAIRCON
             p.device = i
-            Service.send_msg(p)
+            Service.send_msg(p, PRIORITY_POLL)
         p = Sensor2InfoParam()
-        Service.send_msg(p)
+        Service.send_msg(p, PRIORITY_POLL)
 
     @staticmethod
     def update_aircon(target: EnumDevice, room: int, unit: int, **kwargs):
@@ -296,6 +807,8 @@ class Service:
         for item in li:
             i, func = item
             if i.unit_id == unit and i.room_id == room and get_device_by_aircon(i) == target:
+                if 'status' in kwargs:
+                    Service._mark_live(i.unique_id)
                 try:
                     func(**kwargs)
                 except Exception as e:
@@ -305,3 +818,7 @@ class Service:
     @staticmethod
     def get_scan_interval():
         return Service._scan_interval
+
+    @staticmethod
+    def get_topology_interval():
+        return Service._topology_interval
@@ -0,0 +1,104 @@
+"""last known state of every unit and sensor, so entities have one right after a restart
+
+file: MAGIC, a header, then per unit and per sensor its unique id and a fixed size record. Unknown fields
+are stored as _NONE, values the enums no longer know come back as None.
+"""
+import os
+import struct
+import time
+import typing
+
+from .ctrl_enum import SWITCH_BY_VALUE, AIR_FLOW_BY_VALUE, BREATHE_BY_VALUE, FAN_DIRECTION_BY_VALUE, \
+    HUMIDITY_BY_VALUE, MODE_BY_VALUE, VOC_BY_VALUE, EnumSensor
+from .dao import AirCon, AirConStatus, Sensor
+
+MAGIC = b'DSSNAP\x01'
+_HEADER = struct.Struct('<dHH')  # saved at (unix time), units, sensors
+_ID = struct.Struct('<B')  # length of the utf-8 unique id that follows
+_NONE = -128
+_TEMP_NONE = -32768
+# current and target temperature, switch, air flow, breathe, fan directions, humidity, mode
+_STATUS = struct.Struct('<hh7b')
+_STATUS_ENUMS = (('switch', SWITCH_BY_VALUE), ('air_flow', AIR_FLOW_BY_VALUE), ('breathe', BREATHE_BY_VALUE),
+                 ('fan_direction1', FAN_DIRECTION_BY_VALUE), ('fan_direction2', FAN_DIRECTION_BY_VALUE),
+                 ('humidity', HUMIDITY_BY_VALUE), ('mode', MODE_BY_VALUE))
+# readings as decoded, voc as its enum value, then connected and switched on
+_SENSOR = struct.Struct('<7i??')
+_READINGS = ('temp', 'humidity', 'pm25', 'co2', 'voc', 'tvoc', 'hcho')
+
+
+def _write_id(out: typing.List[bytes], unique_id: str):
+    b = unique_id.encode('utf-8')[:255]
+    out.append(_ID.pack(len(b)))
+    out.append(b)
+
+
+def _read_id(data: bytes, pos: int) -> typing.Tuple[str, int]:
+    length, = _ID.unpack_from(data, pos)
+    pos += _ID.size
+    return data[pos:pos + length].decode('utf-8'), pos + length
+
+
+def _value(v) -> int:
+    return _NONE if v is None else int(v)
+
+
+def dump(aircons: typing.List[AirCon], sensors: typing.List[Sensor], saved_at: float = None) -> bytes:
+    out = [MAGIC, _HEADER.pack(time.time() if saved_at is None else saved_at, len(aircons), len(sensors))]
+    for i in aircons:
+        s = i.status
+        _write_id(out, i.unique_id)
+        out.append(_STATUS.pack(_TEMP_NONE if s.current_temp is None else s.current_temp,
+                                _TEMP_NONE if s.setted_temp is None else s.setted_temp,
+                                *(_value(getattr(s, name)) for name, _ in _STATUS_ENUMS)))
+    for i in sensors:
+        _write_id(out, i.unique_id)
+        out.append(_SENSOR.pack(*(int(getattr(i, name)) for name in _READINGS), i.connected, i.switch_on_off))
+    return b''.join(out)
+
+
+def load(data: bytes) -> typing.Tuple[float, typing.Dict[str, AirConStatus], typing.Dict[str, dict]]:
+    """saved at, unique id -> status, unique id -> sensor attributes"""
+    if not data.startswith(MAGIC):
+        raise ValueError('not a ds_air snapshot')
+    pos = len(MAGIC)
+    saved_at, units, sensors = _HEADER.unpack_from(data, pos)
+    pos += _HEADER.size
+    statuses = {}
+    for _ in range(units):
+        unique_id, pos = _read_id(data, pos)
+        values = _STATUS.unpack_from(data, pos)
+        pos += _STATUS.size
+        status = AirConStatus(current_temp=None if values[0] == _TEMP_NONE else values[0],
+                              setted_temp=None if values[1] == _TEMP_NONE else values[1])
+        for (name, table), v in zip(_STATUS_ENUMS, values[2:]):
+            setattr(status, name, None if v == _NONE else table.get(v))
+        statuses[unique_id] = status
+    readings = {}
+    for _ in range(sensors):
+        unique_id, pos = _read_id(data, pos)
+        values = _SENSOR.unpack_from(data, pos)
+        pos += _SENSOR.size
+        d = dict(zip(_READINGS, values))
+        d['voc'] = VOC_BY_VALUE.get(d['voc'], EnumSensor.Voc.STEP_UNUSE)
+        d['connected'], d['switch_on_off'] = values[-2:]
+        readings[unique_id] = d
+    return saved_at, statuses, readings
+
+
+def save(path: str, aircons: typing.List[AirCon], sensors: typing.List[Sensor]):
+    """written aside and renamed, a crash while saving leaves the previous snapshot"""
+    data = dump(aircons, sensors)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def read(path: str):
+    """load() of the file, None when there is none or it cannot be read"""
+    try:
+        with open(path, 'rb') as f:
+            return load(f.read())
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        return None
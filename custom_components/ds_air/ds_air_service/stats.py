@@ -0,0 +1,243 @@
+import time
+import typing
+from bisect import bisect_left
+
+from .ctrl_enum import EnumCmdType
+
+# upper bounds in seconds, the last bucket catches everything above
+_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+            2.5, 5.0, 10.0)
+_OTHER = -1
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKETS) + 1)  # type: typing.List[int]
+        self.count = 0  # type: int
+        self.sum = 0.0  # type: float
+        self.max = 0.0  # type: float
+
+    def observe(self, v: float):
+        self.counts[bisect_left(_BUCKETS, v)] += 1
+        self.count += 1
+        self.sum += v
+        if v > self.max:
+            self.max = v
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @property
+    def avg(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """upper bound of the bucket holding the p-th percentile"""
+        if not self.count:
+            return 0.0
+        rank = p * self.count
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank:
+                return min(_BUCKETS[i], self.max) if i < len(_BUCKETS) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'avg_ms': round(self.avg * 1000, 3),
+            'p50_ms': round(self.percentile(0.5) * 1000, 3),
+            'p90_ms': round(self.percentile(0.9) * 1000, 3),
+            'p99_ms': round(self.percentile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3)
+        }
+
+
+def _cmd_type_counters() -> typing.Dict[int, int]:
+    d = dict.fromkeys(set(i.value for i in EnumCmdType), 0)
+    d[_OTHER] = 0
+    return d
+
+
+def _cmd_type_name(v: int) -> str:
+    # cmd type values are shared between device classes, so the number is the only unambiguous label
+    if v == _OTHER:
+        return 'other'
+    return str(v)
+
+
+class Stats:
+    """transport counters, updated by the socket threads and read by the integration"""
+    frames_in = _cmd_type_counters()  # type: typing.Dict[int, int]
+    frames_out = _cmd_type_counters()  # type: typing.Dict[int, int]
+    frames_in_total = 0  # type: int
+    frames_out_total = 0  # type: int
+    bytes_in = 0  # type: int
+    bytes_out = 0  # type: int
+    decode_time = {}  # type: typing.Dict[str, Histogram]
+    dispatch_time = Histogram()  # type: Histogram
+    recv_queue_depth = 0  # type: int
+    recv_queue_max = 0  # type: int
+    send_queue_depth = 0  # type: int
+    send_queue_max = 0  # type: int
+    throttled_waits = 0  # type: int
+    write_calls = 0  # type: int
+    writes_saved = 0  # type: int
+    reconnects = 0  # type: int
+    heartbeat_rtt = Histogram()  # type: Histogram
+    heartbeats_missed = 0  # type: int
+    unknown_frames = 0  # type: int
+    decode_failures = 0  # type: int
+    malformed_bytes = 0  # type: int
+    dispatch_errors = 0  # type: int
+    duplicates = 0  # type: int
+    _heartbeat_sent = 0.0  # type: float
+    _started = time.time()  # type: float
+
+    @staticmethod
+    def frame_in(cmd_type: int, length: int):
+        d = Stats.frames_in
+        if cmd_type in d:
+            d[cmd_type] += 1
+        else:
+            d[_OTHER] += 1
+        Stats.frames_in_total += 1
+        Stats.bytes_in += length
+
+    @staticmethod
+    def frame_out(cmd_type: int, length: int):
+        d = Stats.frames_out
+        if cmd_type in d:
+            d[cmd_type] += 1
+        else:
+            d[_OTHER] += 1
+        Stats.frames_out_total += 1
+        Stats.bytes_out += length
+
+    @staticmethod
+    def decoded(name: str, elapsed: float):
+        h = Stats.decode_time.get(name)
+        if h is None:
+            h = Stats.decode_time[name] = Histogram()
+        h.observe(elapsed)
+
+    @staticmethod
+    def dispatched(elapsed: float):
+        Stats.dispatch_time.observe(elapsed)
+
+    @staticmethod
+    def recv_queue(depth: int):
+        Stats.recv_queue_depth = depth
+        if depth > Stats.recv_queue_max:
+            Stats.recv_queue_max = depth
+
+    @staticmethod
+    def send_queue(delta: int):
+        Stats.send_queue_depth += delta
+        if Stats.send_queue_depth > Stats.send_queue_max:
+            Stats.send_queue_max = Stats.send_queue_depth
+
+    @staticmethod
+    def written(frames: int, calls: int):
+        """frames went out with calls system calls instead of one each"""
+        Stats.write_calls += calls
+        Stats.writes_saved += frames - calls
+
+    @staticmethod
+    def throttled():
+        """the writer waited for the gateway rate limit"""
+        Stats.throttled_waits += 1
+
+    @staticmethod
+    def reconnected():
+        Stats.reconnects += 1
+
+    @staticmethod
+    def heartbeat_sent():
+        Stats._heartbeat_sent = time.monotonic()
+
+    @staticmethod
+    def heartbeat_received():
+        if Stats._heartbeat_sent:
+            Stats.heartbeat_rtt.observe(time.monotonic() - Stats._heartbeat_sent)
+            Stats._heartbeat_sent = 0.0
+
+    @staticmethod
+    def heartbeat_missed():
+        Stats.heartbeats_missed += 1
+        Stats._heartbeat_sent = 0.0
+
+    @staticmethod
+    def unknown_frame():
+        Stats.unknown_frames += 1
+
+    @staticmethod
+    def decode_failed(length: int = 0):
+        """a malformed frame or a run of garbage of length bytes was skipped"""
+        Stats.decode_failures += 1
+        Stats.malformed_bytes += length
+
+    @staticmethod
+    def deduplicated():
+        Stats.duplicates += 1
+
+    @staticmethod
+    def dispatch_failed():
+        Stats.dispatch_errors += 1
+
+    @staticmethod
+    def reset():
+        for d in (Stats.frames_in, Stats.frames_out):
+            for k in d:
+                d[k] = 0
+        for h in Stats.decode_time.values():
+            h.reset()
+        Stats.dispatch_time.reset()
+        Stats.heartbeat_rtt.reset()
+        Stats.frames_in_total = Stats.frames_out_total = 0
+        Stats.bytes_in = Stats.bytes_out = 0
+        Stats.recv_queue_depth = Stats.recv_queue_max = 0
+        Stats.send_queue_depth = Stats.send_queue_max = 0
+        Stats.throttled_waits = Stats.heartbeats_missed = 0
+        Stats.write_calls = Stats.writes_saved = 0
+        Stats.reconnects = Stats.unknown_frames = Stats.decode_failures = 0
+        Stats.malformed_bytes = Stats.dispatch_errors = Stats.duplicates = 0
+        Stats._heartbeat_sent = 0.0
+        Stats._started = time.time()
+
+    @staticmethod
+    def snapshot() -> dict:
+        """plain dict of every metric, cheap enough to call from a service handler"""
+        return {
+            'uptime': round(time.time() - Stats._started),
+            'frames_in': Stats.frames_in_total,
+            'frames_out': Stats.frames_out_total,
+            'bytes_in': Stats.bytes_in,
+            'bytes_out': Stats.bytes_out,
+            'frames_in_by_type': {_cmd_type_name(k): v for k, v in Stats.frames_in.items() if v},
+            'frames_out_by_type': {_cmd_type_name(k): v for k, v in Stats.frames_out.items() if v},
+            'decode_time': {k: v.snapshot() for k, v in Stats.decode_time.items()},
+            'dispatch_time': Stats.dispatch_time.snapshot(),
+            'recv_queue_depth': Stats.recv_queue_depth,
+            'recv_queue_max': Stats.recv_queue_max,
+            'send_queue_depth': Stats.send_queue_depth,
+            'send_queue_max': Stats.send_queue_max,
+            'throttled_waits': Stats.throttled_waits,
+            'write_calls': Stats.write_calls,
+            'writes_saved': Stats.writes_saved,
+            'reconnects': Stats.reconnects,
+            'heartbeat_rtt': Stats.heartbeat_rtt.snapshot(),
+            'heartbeats_missed': Stats.heartbeats_missed,
+            'unknown_frames': Stats.unknown_frames,
+            'decode_failures': Stats.decode_failures,
+            'malformed_bytes': Stats.malformed_bytes,
+            'dispatch_errors': Stats.dispatch_errors,
+            'duplicates': Stats.duplicates
+        }
@@ -0,0 +1,244 @@
+"""Scaling benchmarks for discovery, decode + dispatch and polling against the local simulator
+
+    python -m ds_air_service.tools.benchmark --units 10 100 500 --output bench.json
+    python -m ds_air_service.tools.benchmark --compare bench.json
+
+Each case reports seconds per operation; --compare prints the change against a previous run.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import typing
+
+from ..ctrl_enum import EnumDevice, EnumCmdType, EnumControl, AIR_FLOW_NAMES, MODE_BY_VALUE, DEVICE_BY_VALUE
+from ..dao import Sensor
+from ..decoder import decoder, iter_frames
+from ..service import Service
+from ..stats import Stats
+from .simulator import GatewaySimulator, Topology, frame
+
+_CASES = {}  # type: typing.Dict[str, typing.Callable]
+
+
+def case(name: str):
+    def wrap(func):
+        _CASES[name] = func
+        return func
+    return wrap
+
+
+def measure(func: typing.Callable, number: int = 1000, repeat: int = 5) -> dict:
+    """seconds per call, best and median of `repeat` runs of `number` calls"""
+    times = [t / number for t in timeit.Timer(func).repeat(repeat, number)]
+    return {'best': min(times), 'median': statistics.median(times), 'number': number, 'repeat': repeat}
+
+
+def topology(units: int, sensors: int = 0) -> Topology:
+    rooms = min(units, 50)
+    return Topology(rooms, units // rooms, sensors)
+
+
+class _Counter:
+    def __init__(self):
+        self.n = 0
+
+    def hook(self, **kwargs):
+        if kwargs.get('status') is not None:
+            self.n += 1
+
+
+@case('scaling')
+def bench_scaling(args) -> dict:
+    res = {}
+    for units in args.units:
+        sim = GatewaySimulator(topology(units, args.sensors)).start_background()
+        try:
+            start = time.perf_counter()
+            # the client is measured, not the gateway's rate limit
+            Service.init('127.0.0.1', sim.port, 5, rate=0)
+            elapsed = time.perf_counter() - start
+            res['discovery_%d' % units] = {'best': elapsed, 'median': elapsed, 'number': 1, 'repeat': 1}
+            aircons = Service.get_aircons()
+            counter = _Counter()
+            for i in aircons:
+                # one hook per unit, like one DsAir entity each
+                Service.register_status_hook(i, counter.hook)
+
+            frames = [frame(1, EnumDevice.NEWAIRCON, EnumCmdType.STATUS_CHANGED, sim.status_body(u))
+                      for u in sim.topology.units]
+            it = itertools.cycle(frames)
+
+            def decode_dispatch():
+                decoder(next(it))[0].do()
+            res['decode_dispatch_status_%d' % units] = measure(decode_dispatch, 2000)
+
+            status = aircons[0].status
+
+            def update_aircon():
+                u = random.choice(aircons)
+                Service.update_aircon(EnumDevice.NEWAIRCON, u.room_id, u.unit_id, status=status)
+            res['update_aircon_%d' % units] = measure(update_aircon, 2000)
+
+            sensors = []
+            for r in range(units):
+                s = Sensor()
+                s.room_id, s.unit_id = r, 0
+                s.name = s.alias = 'bench%d' % r
+                sensors.append(s)
+            Service.set_sensors(sensors)
+            for s in sensors:
+                Service.register_sensor_hook(s.unique_id, lambda device: None)
+            res['set_sensors_status_%d' % units] = measure(lambda: Service.set_sensors_status(sensors), 20)
+
+            times = []
+            for _ in range(3):
+                # unchanged answers are dropped before decoding, so count frames rather than hook calls
+                target = Stats.frames_in[EnumCmdType.QUERY_STATUS.value] + len(Service._new_aircons)
+                start = time.perf_counter()
+                Service.poll_status()
+                deadline = time.monotonic() + 60
+                while Stats.frames_in[EnumCmdType.QUERY_STATUS.value] < target and time.monotonic() < deadline:
+                    time.sleep(0.0005)
+                times.append(time.perf_counter() - start)
+            res['poll_cycle_%d' % units] = {'best': min(times), 'median': statistics.median(times), 'number': 1,
+                                            'repeat': len(times)}
+        finally:
+            Service.destroy()
+            sim.stop_background()
+    return res
+
+
+@case('decode')
+def bench_decode(args) -> dict:
+    res = {}
+    sim = GatewaySimulator(topology(max(args.units), args.sensors))
+    for units in args.units:
+        sim.topology = topology(units, args.sensors)
+        rooms = bytes([sim.topology.rooms]) + b''.join(bytes([r, 1, 0]) for r in range(1, sim.topology.rooms + 1))
+        room_info = frame(1, EnumDevice.SYSTEM, EnumCmdType.SYS_GET_ROOM_INFO, sim.room_info_body())
+        capability = frame(1, EnumDevice.NEWAIRCON, EnumCmdType.AIR_CAPABILITY_QUERY,
+                           sim.capability_body(EnumDevice.NEWAIRCON, rooms))
+        res['decode_room_info_%d' % units] = measure(lambda: decoder(room_info), 100)
+        res['decode_capability_%d' % units] = measure(lambda: decoder(capability), 100)
+    unit = sim.topology.units[0]
+    status = frame(1, EnumDevice.NEWAIRCON, EnumCmdType.STATUS_CHANGED, sim.status_body(unit))
+    query = frame(1, EnumDevice.NEWAIRCON, EnumCmdType.QUERY_STATUS, sim.status_body(unit, query=True))
+    res['decode_status_changed'] = measure(lambda: decoder(status), 5000)
+    res['decode_query_status'] = measure(lambda: decoder(query), 5000)
+    for sensors in (1, 50, 100):
+        sim.topology = Topology(sensors, 1, 1)
+        info = frame(1, EnumDevice.SYSTEM, EnumCmdType.SENSOR2_INFO, sim.sensor2_info_body())
+        res['decode_sensor2_info_%d' % sensors] = measure(lambda: decoder(info)[0].ensure_loaded(), 200)
+
+    # a buffer of back to back frames, like a capture or a debug log
+    frames = b''.join(frame(i, EnumDevice.NEWAIRCON, EnumCmdType.STATUS_CHANGED, sim.status_body(u))
+                      for i, u in enumerate(sim.topology.units))
+
+    def chained(b):
+        while b:
+            _, b = decoder(b)
+
+    for size in (1 << 16, 1 << 20):
+        buf = frames * (size // len(frames) + 1)
+        res['decode_stream_%dk' % (size >> 10)] = measure(lambda: sum(1 for _ in iter_frames(buf)), 1, 3)
+        if size <= 1 << 16:
+            res['decode_chained_%dk' % (size >> 10)] = measure(lambda: chained(buf), 1, 3)
+    return res
+
+
+@case('lookup')
+def bench_lookup(args) -> dict:
+    """enum construction against the lookup tables, per decoded field and per climate property"""
+    air_flow = EnumControl.AirFlow.AUTO
+    return {
+        'lookup_field_enum_call': measure(lambda: EnumControl.Mode(4), 100000),
+        'lookup_field_table': measure(lambda: MODE_BY_VALUE[4], 100000),
+        'lookup_device_enum_call': measure(lambda: EnumDevice((8, 23)), 100000),
+        'lookup_device_table': measure(lambda: DEVICE_BY_VALUE[(8, 23)], 100000),
+        'lookup_fan_mode_index': measure(lambda: EnumControl.AirFlow(list(AIR_FLOW_NAMES).index('自动')), 100000),
+        'lookup_fan_mode_table': measure(lambda: EnumControl.get_air_flow_enum('自动'), 100000),
+        'lookup_fan_name_value': measure(lambda: EnumControl.get_air_flow_name(air_flow.value), 100000),
+        'lookup_fan_name_member': measure(lambda: EnumControl.get_air_flow_name(air_flow), 100000),
+    }
+
+
+_IMPORT = '''
+import sys, time
+t = time.perf_counter()
+import %s.service
+t = time.perf_counter() - t
+print(t, any(i == 'homeassistant' or i.startswith('homeassistant.') for i in sys.modules))
+'''
+
+
+@case('import')
+def bench_import(args) -> dict:
+    """seconds to import the protocol core in a fresh interpreter, which must not pull in Home Assistant"""
+    code = _IMPORT % __package__.rsplit('.', 1)[0]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    times = []
+    for _ in range(5):
+        out = subprocess.run([sys.executable, '-c', code], env=env, check=True, capture_output=True, text=True)
+        t, ha = out.stdout.split()
+        if ha == 'True':
+            print('importing the protocol core imported homeassistant', file=sys.stderr)
+        times.append(float(t))
+    return {'import_service': {'best': min(times), 'median': statistics.median(times), 'number': 1, 'repeat': 5}}
+
+
+def run(args) -> dict:
+    from ..config import Config
+    Config.is_new_version = True
+    results = {}
+    for name in args.cases:
+        print('running %s' % name, file=sys.stderr)
+        results.update(_CASES[name](args))
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'units': args.units
+        },
+        'results': results
+    }
+
+
+def compare(old: dict, new: dict):
+    for k, v in new['results'].items():
+        o = old['results'].get(k)
+        if o is None:
+            print('%-36s %12.3f us' % (k, v['best'] * 1e6))
+        else:
+            print('%-36s %12.3f us %+8.1f%%' % (k, v['best'] * 1e6, (v['best'] / o['best'] - 1) * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--units', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--sensors', type=int, default=1, help='simulated sensors per room')
+    parser.add_argument('--cases', nargs='+', choices=list(_CASES), default=list(_CASES))
+    parser.add_argument('--output', help='write the results as json')
+    parser.add_argument('--compare', help='json file of a previous run')
+    args = parser.parse_args()
+    res = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(res, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), res)
+    else:
+        compare({'results': {}}, res)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Fuzz the frame reader and the receive loop with random, truncated and corrupted input
+
+    python -m ds_air_service.tools.fuzz --iterations 5000 --seed 1
+
+Checks that nothing raises out of FrameReader, that valid frames separated by garbage without a start
+byte are all recovered whatever the chunking, that lazy results decode without raising, and that
+RecvThread survives results whose do() fails. Exits non-zero with the failing input on the first error.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+import typing
+
+from ..config import Config
+from ..ctrl_enum import EnumDevice, EnumCmdType
+from ..decoder import FrameReader, BaseResult
+from ..display import summarize
+from ..service import RecvThread
+from ..stats import Stats
+from .simulator import GatewaySimulator, Topology, frame
+
+
+def corpus() -> typing.List[bytes]:
+    """one valid frame of every kind the simulator can produce"""
+    sim = GatewaySimulator(Topology(3, 2, 1))
+    unit = sim.topology.units[0]
+    rooms = bytes([3]) + b''.join(bytes([r, 1, 0]) for r in range(1, 4))
+    return [
+        b'\x02\x00\x00\x03',
+        frame(1, EnumDevice.SYSTEM, EnumCmdType.SYS_ACK, b'\x02'),
+        frame(2, EnumDevice.SYSTEM, EnumCmdType.SYS_HAND_SHAKE, b'20230101120000'),
+        frame(3, EnumDevice.SYSTEM, EnumCmdType.SYS_GET_ROOM_INFO, sim.room_info_body()),
+        frame(4, EnumDevice.NEWAIRCON, EnumCmdType.AIR_CAPABILITY_QUERY,
+              sim.capability_body(EnumDevice.NEWAIRCON, rooms)),
+        frame(5, EnumDevice.NEWAIRCON, EnumCmdType.STATUS_CHANGED, sim.status_body(unit)),
+        frame(6, EnumDevice.NEWAIRCON, EnumCmdType.QUERY_STATUS, sim.status_body(unit, query=True)),
+        frame(7, EnumDevice.SYSTEM, EnumCmdType.SENSOR2_INFO, sim.sensor2_info_body()),
+        frame(8, EnumDevice.SYSTEM, 0x7777, b'\x01\x02\x03'),
+    ]
+
+
+def _garbage(rnd: random.Random, n: int, start_byte: bool = True) -> bytes:
+    b = bytes(rnd.getrandbits(8) for _ in range(n))
+    return b if start_byte else b.replace(b'\x02', b'\x01')
+
+
+def mutate(rnd: random.Random, b: bytes) -> bytes:
+    kind = rnd.randrange(5)
+    if kind == 0:
+        return b[:rnd.randrange(len(b))]
+    if kind == 1:
+        i = rnd.randrange(len(b))
+        return b[:i] + bytes([b[i] ^ (1 << rnd.randrange(8))]) + b[i + 1:]
+    if kind == 2:
+        i = rnd.randrange(len(b) + 1)
+        return b[:i] + _garbage(rnd, rnd.randint(1, 8)) + b[i:]
+    if kind == 3:
+        i = rnd.randrange(len(b))
+        return b[:i] + b[i + rnd.randint(1, 8):]
+    return _garbage(rnd, rnd.randint(1, 64))
+
+
+def chunks(rnd: random.Random, b: bytes) -> typing.Iterator[bytes]:
+    pos = 0
+    while pos < len(b):
+        n = rnd.randint(1, 64)
+        yield b[pos:pos + n]
+        pos += n
+
+
+def read_all(rnd: random.Random, b: bytes) -> typing.List[BaseResult]:
+    reader = FrameReader()
+    res = []
+    for c in chunks(rnd, b):
+        reader.feed(c)
+        res.extend(r for _, _, r in reader.frames())
+    res.extend(r for _, _, r in reader.frames(final=True))
+    for r in res:
+        # properties of lazy results decode the body
+        summarize(r)
+    return res
+
+
+class _FakeSocket:
+    def __init__(self, batches: typing.List[typing.List[BaseResult]]):
+        self._batches = batches
+        self.done = threading.Event()
+
+    def recv(self):
+        if not self._batches:
+            self.done.set()
+            time.sleep(0.01)
+            return [], None
+        return self._batches.pop(0), None
+
+
+class _Broken(BaseResult):
+    def __init__(self):
+        BaseResult.__init__(self, 0, EnumDevice.SYSTEM, EnumCmdType.SYS_ACK)
+
+    def do(self):
+        raise ValueError('broken result')
+
+
+def check_recv_thread(results: typing.List[BaseResult]) -> bool:
+    """the receive loop is still alive after dispatching everything, including failing results"""
+    batches = [[_Broken()]] + [results[i:i + 4] for i in range(0, len(results), 4)] + [[_Broken()]]
+    sock = _FakeSocket(batches)
+    t = RecvThread(sock)
+    t.daemon = True
+    t.start()
+    sock.done.wait(30)
+    alive = t.is_alive()
+    t.terminate()
+    return alive and sock.done.is_set()
+
+
+def run(iterations: int, seed: int) -> int:
+    Config.is_new_version = True
+    rnd = random.Random(seed)
+    valid = corpus()
+    failures = 0
+    dispatched = []
+    for n in range(iterations):
+        frames = [rnd.choice(valid) for _ in range(rnd.randint(1, 6))]
+        # garbage without start bytes between valid frames: every frame must come back
+        clean = b''.join(_garbage(rnd, rnd.randint(0, 8), False) + f for f in frames)
+        # anything goes: mutated frames, random bytes
+        dirty = b''.join(mutate(rnd, f) if rnd.random() < 0.5 else f for f in frames)
+        for b, expect in ((clean, len(frames)), (dirty, None)):
+            try:
+                res = read_all(rnd, b)
+            except Exception as e:
+                print('iteration %d raised %r on %s' % (n, e, b.hex()), file=sys.stderr)
+                failures += 1
+                continue
+            if expect is not None and len(res) != expect:
+                print('iteration %d recovered %d of %d frames from %s' % (n, len(res), expect, b.hex()),
+                      file=sys.stderr)
+                failures += 1
+            if len(dispatched) < 2000:
+                dispatched.extend(res)
+        if failures:
+            break
+    if not failures and not check_recv_thread(dispatched):
+        print('receive loop died', file=sys.stderr)
+        failures += 1
+    print('%d iterations, %d failures, %d malformed frames skipped' % (
+        iterations, failures, Stats.decode_failures), file=sys.stderr)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    seed = args.seed if args.seed is not None else random.randrange(1 << 32)
+    print('seed %d' % seed, file=sys.stderr)
+    sys.exit(1 if run(args.iterations, seed) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Turn the "hex: 0x..." lines of Home Assistant debug logs into per-unit status and sensor tables
+
+    python -m ds_air_service.tools.logparse home-assistant.log* --output ds_air --jobs 4
+    python -m ds_air_service.tools.logparse home-assistant.log --format csv --new-version
+
+Writes <output>_status and <output>_sensors as csv or parquet (needs pyarrow), or a single <output>.npz
+(needs numpy). The default picks parquet, then npz, then csv, depending on what is installed. Log files
+are read line by line, gzip'ed ones too, and decoded one per process with --jobs.
+"""
+import argparse
+import csv
+import datetime
+import gzip
+import re
+import sys
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+
+from ..config import Config
+from ..decoder import FrameReader, AirConStatusChangedResult, AirConQueryStatusResult, Sensor2InfoResult
+from ..stats import Stats
+
+_LINE = re.compile(r'^(?:(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d+)?) )?.*?hex: 0x([0-9a-fA-F]+)')
+
+STATUS_COLUMNS = ['time', 'target', 'room', 'unit', 'query', 'switch', 'mode', 'air_flow', 'current_temp',
+                  'setted_temp', 'fan_direction1', 'fan_direction2', 'humidity', 'breathe']
+SENSOR_COLUMNS = ['time', 'room', 'unit', 'mac', 'name', 'sensor_type', 'connected', 'temp', 'humidity', 'pm25',
+                  'co2', 'voc', 'tvoc', 'hcho']
+_STRING_COLUMNS = {'target', 'mac', 'name'}
+
+
+def _num(v) -> int:
+    """enums and flags as plain numbers, -1 for values the frame did not carry"""
+    if v is None:
+        return -1
+    if isinstance(v, Enum):
+        return v.value
+    return int(v)
+
+
+def _time(s: typing.Optional[str]) -> float:
+    if s is None:
+        return float('nan')
+    fmt = '%Y-%m-%d %H:%M:%S.%f' if '.' in s else '%Y-%m-%d %H:%M:%S'
+    return datetime.datetime.strptime(s, fmt).timestamp()
+
+
+def _open(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+def parse_file(path: str, new_version: bool = False, c611: bool = True) -> dict:
+    """{'status': columns, 'sensors': columns, 'frames': n, 'errors': n} for one log file"""
+    Config.is_new_version = new_version
+    Config.is_c611 = c611
+    status = {k: [] for k in STATUS_COLUMNS}
+    sensors = {k: [] for k in SENSOR_COLUMNS}
+    frames = errors = 0
+    failures = Stats.decode_failures
+    # frames split over several lines by older versions are joined again by the reader
+    reader = FrameReader()
+    with _open(path) as f:
+        for line in f:
+            m = _LINE.match(line)
+            if m is None:
+                continue
+            try:
+                reader.feed(bytes.fromhex(m.group(2)))
+            except ValueError:
+                errors += 1
+                continue
+            ts = None
+            for _, _, r in reader.frames():
+                frames += 1
+                if ts is None:
+                    ts = _time(m.group(1))
+                if isinstance(r, AirConStatusChangedResult):
+                    st = r.status
+                    values = [ts, r.target.name, r.room, r.unit, 0, st.switch, st.mode, st.air_flow,
+                              st.current_temp, st.setted_temp, st.fan_direction1, st.fan_direction2, st.humidity,
+                              st.breathe]
+                elif isinstance(r, AirConQueryStatusResult):
+                    values = [ts, r.target.name, r.room, r.unit, 1, r.switch, r.mode, r.air_flow, r.current_temp,
+                              r.setted_temp, r.fan_direction1, r.fan_direction2, r.humidity, r.breathe]
+                elif isinstance(r, Sensor2InfoResult):
+                    for i in r.sensors:
+                        for k, v in zip(SENSOR_COLUMNS, (ts, i.room_id, i.unit_id, i.mac, i.name, i.sensor_type,
+                                                         i.connected, i.temp, i.humidity, i.pm25, i.co2, i.voc,
+                                                         i.tvoc, i.hcho)):
+                            sensors[k].append(v if k == 'time' or k in _STRING_COLUMNS else _num(v))
+                    continue
+                else:
+                    continue
+                for k, v in zip(STATUS_COLUMNS, values):
+                    status[k].append(v if k == 'time' or k in _STRING_COLUMNS else _num(v))
+    return {'status': status, 'sensors': sensors, 'frames': frames, 'errors': errors + Stats.decode_failures - failures}
+
+
+def _merge(a: dict, b: dict):
+    for table in ('status', 'sensors'):
+        for k, v in b[table].items():
+            a[table][k].extend(v)
+    a['frames'] += b['frames']
+    a['errors'] += b['errors']
+
+
+def write_csv(prefix: str, tables: dict):
+    for name, columns in tables.items():
+        with open('%s_%s.csv' % (prefix, name), 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(list(columns))
+            w.writerows(zip(*columns.values()))
+
+
+def write_parquet(prefix: str, tables: dict):
+    import pyarrow
+    import pyarrow.parquet
+    for name, columns in tables.items():
+        pyarrow.parquet.write_table(pyarrow.table(columns), '%s_%s.parquet' % (prefix, name))
+
+
+def write_npz(prefix: str, tables: dict):
+    import numpy
+    arrays = {}
+    for name, columns in tables.items():
+        for k, v in columns.items():
+            if k == 'time':
+                dtype = numpy.float64
+            elif k in _STRING_COLUMNS:
+                dtype = str
+            else:
+                dtype = numpy.int32
+            arrays['%s_%s' % (name, k)] = numpy.asarray(v, dtype=dtype)
+    numpy.savez_compressed(prefix + '.npz', **arrays)
+
+
+_WRITERS = {'csv': write_csv, 'parquet': write_parquet, 'npz': write_npz}
+_REQUIRES = {'parquet': 'pyarrow', 'npz': 'numpy'}
+
+
+def _available(fmt: str) -> bool:
+    if fmt not in _REQUIRES:
+        return True
+    try:
+        __import__(_REQUIRES[fmt])
+        return True
+    except ImportError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--output', default='ds_air', help='output file prefix')
+    parser.add_argument('--format', choices=['auto'] + list(_WRITERS), default='auto')
+    parser.add_argument('--jobs', type=int, default=1, help='decode this many files in parallel')
+    parser.add_argument('--gw', choices=('c611', 'b611'), default='c611')
+    parser.add_argument('--new-version', action='store_true',
+                        help='gateway firmware 1.3 or later, until a handshake in the log says otherwise')
+    args = parser.parse_args()
+    fmt = args.format
+    if fmt == 'auto':
+        fmt = next(i for i in ('parquet', 'npz', 'csv') if _available(i))
+    elif not _available(fmt):
+        parser.error('%s output needs %s' % (fmt, _REQUIRES[fmt]))
+
+    res = {'status': {k: [] for k in STATUS_COLUMNS}, 'sensors': {k: [] for k in SENSOR_COLUMNS},
+           'frames': 0, 'errors': 0}
+    c611 = args.gw == 'c611'
+    if args.jobs > 1 and len(args.logs) > 1:
+        with ProcessPoolExecutor(args.jobs) as pool:
+            n = len(args.logs)
+            for i in pool.map(parse_file, args.logs, [args.new_version] * n, [c611] * n):
+                _merge(res, i)
+    else:
+        for path in args.logs:
+            _merge(res, parse_file(path, args.new_version, c611))
+    _WRITERS[fmt](args.output, {'status': res['status'], 'sensors': res['sensors']})
+    print('%d frames, %d status rows, %d sensor rows, %d errors, written as %s' % (
+        res['frames'], len(res['status']['time']), len(res['sensors']['time']), res['errors'], fmt), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Replay a session captured with Service.start_capture
+
+    python -m ds_air_service.tools.replay session.dscap > decoded.jsonl
+    python -m ds_air_service.tools.replay session.dscap --service --speed 0
+
+The default mode decodes every inbound frame and prints one json line per frame, so the output of two
+decoder versions can be diffed; --service runs the capture through Service without a socket and prints
+the resulting devices.
+"""
+import argparse
+import json
+import sys
+
+from ..capture import read_capture
+from ..config import Config
+from ..decoder import inspect_frame
+from ..display import summarize
+from ..ring import DIRECTION_IN
+
+
+def dump(path: str, outbound: bool = False):
+    for ts, direction, data in read_capture(path):
+        line = {'time': round(ts, 6), 'direction': 'in' if direction == DIRECTION_IN else 'out', 'hex': data.hex()}
+        if direction == DIRECTION_IN:
+            # inspect_frame leaves Config as --new-version set it, whatever the acks in the capture say
+            try:
+                result = inspect_frame(data)
+            except Exception as e:
+                line['error'] = repr(e)
+            else:
+                if result is None:
+                    line['error'] = 'not a complete frame'
+                else:
+                    line['decoded'] = summarize(result)
+        elif not outbound:
+            continue
+        print(json.dumps(line, ensure_ascii=False))
+
+
+def run_service(path: str, speed: float):
+    from ..service import Service
+    Service.replay(path, speed)
+    try:
+        Service.get_client().finished.wait()
+        json.dump({
+            'rooms': summarize(Service.get_rooms() or []),
+            'aircons': summarize(Service.get_aircons()),
+            'sensors': summarize(Service.get_sensors())
+        }, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    finally:
+        Service.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('path')
+    parser.add_argument('--service', action='store_true', help='feed the capture through Service')
+    parser.add_argument('--speed', type=float, default=0, help='1 keeps the recorded timing, 0 is as fast as possible')
+    parser.add_argument('--outbound', action='store_true', help='also print the frames that were sent')
+    parser.add_argument('--new-version', action='store_true', help='gateway firmware 1.3 or later')
+    parser.add_argument('--b611', action='store_true', help='DS-AIR b611 instead of c611')
+    args = parser.parse_args()
+    Config.is_new_version = args.new_version
+    Config.is_c611 = not args.b611
+    if args.service:
+        run_service(args.path, args.speed)
+    else:
+        dump(args.path, args.outbound)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""DTA117 gateway simulator
+
+Answers handshake, room info, capability, status query and SENSOR2_INFO requests for a generated
+topology and pushes STATUS_CHANGED frames, optionally with latency, fragmented writes and disconnects.
+
+    python -m ds_air_service.tools.simulator --rooms 10 --units 4 --sensors 1 --push-rate 5
+"""
+import argparse
+import asyncio
+import logging
+import random
+import struct
+import threading
+import time
+import typing
+
+from ..ctrl_enum import EnumDevice, EnumCmdType
+
+_LOGGER = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<BBBBIBIBH')  # everything between the length field and the subbody
+
+
+def frame(cmd_id: int, device: EnumDevice, cmd_type: int, subbody: bytes = b'', need_ack: int = 0,
+          subbody_ver: int = 1) -> bytes:
+    """same layout as Param.to_string"""
+    body = _HEADER.pack(13, 0, subbody_ver, 0, cmd_id, device.value[0], device.value[1], need_ack, cmd_type) + subbody
+    return struct.pack('<BH', 2, len(body)) + body + b'\x03'
+
+
+def _utf(s: str) -> bytes:
+    b = s.encode('utf-8')
+    return struct.pack('<B', len(b)) + b
+
+
+class SimUnit:
+    def __init__(self, room_id: int, unit_id: int):
+        self.room_id = room_id
+        self.unit_id = unit_id
+        self.switch = 0
+        self.mode = 0
+        self.air_flow = 5
+        self.setted_temp = 260
+        self.current_temp = 250
+        self.fan_direction1 = 1
+        self.fan_direction2 = 1
+        self.humidity = 0
+
+
+class SimSensor:
+    def __init__(self, room_id: int, unit_id: int):
+        self.room_id = room_id
+        self.unit_id = unit_id
+        self.mac = bytes([0xa0, 0xb1, 0, 0, room_id, unit_id])
+        self.name = 's%d-%d' % (room_id, unit_id)
+        self.temp = 250
+        self.humidity = 500
+        self.pm25 = 10
+        self.co2 = 600
+        self.tvoc = 5
+        self.hcho = 2
+
+
+class Topology:
+    """rooms 1..rooms, each with `units` new aircons and `sensors` air sensors"""
+
+    def __init__(self, rooms: int = 4, units: int = 1, sensors: int = 1):
+        if not 0 < rooms < 256:
+            raise ValueError('rooms must be in 1..255, capability queries carry one byte room ids')
+        self.rooms = rooms
+        self.units = [SimUnit(r, u) for r in range(1, rooms + 1) for u in range(units)]
+        self.sensors = [SimSensor(r, u) for r in range(1, rooms + 1) for u in range(sensors)]
+        self.units_per_room = units
+        self.sensors_per_room = sensors
+
+    def unit(self, room_id: int, unit_id: int) -> typing.Optional[SimUnit]:
+        for i in self.units:
+            if i.room_id == room_id and i.unit_id == unit_id:
+                return i
+        return None
+
+
+class GatewaySimulator:
+    def __init__(self, topology: Topology = None, host: str = '127.0.0.1', port: int = 0, c611: bool = True,
+                 push_rate: float = 0, latency: float = 0, jitter: float = 0, fragment: int = 0,
+                 disconnect_every: float = 0):
+        """push_rate: STATUS_CHANGED pushes per second, latency/jitter: seconds before each answer,
+        fragment: max chunk size of writes (0 = whole frames), disconnect_every: seconds per connection"""
+        self.topology = topology or Topology()
+        self.host = host
+        self.port = port
+        self.c611 = c611
+        self.push_rate = push_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.fragment = fragment
+        self.disconnect_every = disconnect_every
+        self.frames_in = 0
+        self.frames_out = 0
+        self.connections = 0
+        self._server = None  # type: typing.Optional[asyncio.AbstractServer]
+        self._writers = []  # type: typing.List[asyncio.StreamWriter]
+        self._cnt = 0x10000
+        self._loop = None  # type: typing.Optional[asyncio.AbstractEventLoop]
+        self._thread = None  # type: typing.Optional[threading.Thread]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        _LOGGER.info('simulator listening on %s:%d', self.host, self.port)
+
+    async def stop(self):
+        for w in list(self._writers):
+            w.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def start_background(self) -> 'GatewaySimulator':
+        """run the event loop in a daemon thread, for driving the blocking Service from the same process"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_background(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def _next_cnt(self) -> int:
+        self._cnt += 1
+        return self._cnt
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self._writers.append(writer)
+        tasks = []
+        if self.push_rate > 0:
+            tasks.append(asyncio.ensure_future(self._push(writer)))
+        if self.disconnect_every > 0:
+            tasks.append(asyncio.get_running_loop().call_later(self.disconnect_every, writer.close))
+        try:
+            while True:
+                b = await reader.readexactly(1)
+                if b[0] != 2:
+                    continue
+                length = struct.unpack('<H', await reader.readexactly(2))[0]
+                rest = await reader.readexactly(length + 1)
+                self.frames_in += 1
+                if length == 0:
+                    await self._send(writer, b'\x02\x00\x00\x03')
+                    continue
+                _, _, subbody_ver, _, cnt, dev_type, dev_id, need_ack, cmd_type = _HEADER.unpack_from(rest)
+                subbody = rest[_HEADER.size:-1]
+                try:
+                    device = EnumDevice((dev_type, dev_id))
+                except ValueError:
+                    device = None
+                await self._answer(writer, cnt, device, cmd_type, subbody, need_ack)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for t in tasks:
+                t.cancel()
+            if writer in self._writers:
+                self._writers.remove(writer)
+            writer.close()
+
+    async def _send(self, writer: asyncio.StreamWriter, data: bytes):
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+        if writer.is_closing():
+            return
+        if self.fragment:
+            pos = 0
+            while pos < len(data):
+                n = random.randint(1, self.fragment)
+                writer.write(data[pos:pos + n])
+                await writer.drain()
+                await asyncio.sleep(0)
+                pos += n
+        else:
+            writer.write(data)
+            await writer.drain()
+
+    async def _answer(self, writer, cnt: int, device: EnumDevice, cmd_type: int, subbody: bytes, need_ack: int):
+        out = []
+        if need_ack:
+            out.append(frame(cnt, EnumDevice.SYSTEM, EnumCmdType.SYS_ACK, b'\x02'))
+        if device == EnumDevice.SYSTEM:
+            if cmd_type == EnumCmdType.SYS_HAND_SHAKE:
+                out.append(frame(cnt, device, cmd_type, time.strftime('%Y%m%d%H%M%S').encode()))
+            elif cmd_type == EnumCmdType.SYS_GET_ROOM_INFO:
+                out.append(frame(cnt, device, cmd_type, self.room_info_body()))
+        elif device == EnumDevice.SENSOR and cmd_type == EnumCmdType.SENSOR2_INFO:
+            out.append(frame(cnt, device, cmd_type, self.sensor2_info_body()))
+        elif device is None:
+            pass
+        elif cmd_type == EnumCmdType.AIR_CAPABILITY_QUERY:
+            out.append(frame(cnt, device, cmd_type, self.capability_body(device, subbody)))
+        elif cmd_type == EnumCmdType.AIR_RECOMMENDED_INDOOR_TEMP:
+            out.append(frame(cnt, device, cmd_type, struct.pack('<HH', 260, 300)))
+        elif cmd_type == EnumCmdType.QUERY_STATUS:
+            unit = self.topology.unit(subbody[0], subbody[1])
+            if unit is not None:
+                out.append(frame(cnt, device, cmd_type, self.status_body(unit, query=True)))
+        elif cmd_type == EnumCmdType.CONTROL:
+            unit = self.topology.unit(subbody[0], subbody[1])
+            if unit is not None:
+                self._control(unit, subbody[2], subbody[3:])
+                out.append(frame(self._next_cnt(), device, EnumCmdType.STATUS_CHANGED, self.status_body(unit)))
+        self.frames_out += len(out)
+        await self._send(writer, b''.join(out))
+
+    def room_info_body(self) -> bytes:
+        t = self.topology
+        b = struct.pack('<HB', t.rooms, t.rooms)
+        for r in range(1, t.rooms + 1):
+            b += struct.pack('<HB', r, 3) + _utf('R%d' % r) + _utf('room%d' % r) + _utf('%d.png' % r)
+            b += struct.pack('<H', 2)
+            b += struct.pack('<IH', EnumDevice.NEWAIRCON.value[1], t.units_per_room)
+            for u in range(t.units_per_room):
+                b += _utf('R%d-%d' % (r, u)) + _utf('R%d-%d' % (r, u))
+            b += struct.pack('<IH', EnumDevice.SENSOR.value[1], t.sensors_per_room)
+            for u in range(t.sensors_per_room):
+                b += _utf('s%d-%d' % (r, u)) + _utf('s%d-%d' % (r, u))
+        return b
+
+    def capability_body(self, device: EnumDevice, subbody: bytes) -> bytes:
+        if device != EnumDevice.NEWAIRCON or not subbody:
+            return b'\x00'
+        rooms = [subbody[1 + 3 * i] for i in range(subbody[0])]
+        b = struct.pack('<B', len(rooms))
+        for r in rooms:
+            units = [i for i in self.topology.units if i.room_id == r]
+            b += struct.pack('<BB', r, len(units))
+            for u in units:
+                # fan volume stepless, dry/auto/heat/cool/ventilation; swing both ways; relax/sleep
+                b += struct.pack('<BBBB', u.unit_id, 0xff, 0x1f, 0x03)
+        return b
+
+    def status_body(self, unit: SimUnit, query: bool = False) -> bytes:
+        if query:
+            if self.c611:
+                return struct.pack('<BBBBBBHBB', unit.room_id, unit.unit_id, 0x77, unit.switch, unit.mode,
+                                   unit.air_flow, unit.setted_temp,
+                                   unit.fan_direction1 | unit.fan_direction2 << 4, unit.humidity)
+            return struct.pack('<BBBBBBHHBB', unit.room_id, unit.unit_id, 0x7f, unit.switch, unit.mode,
+                               unit.air_flow, unit.current_temp, unit.setted_temp,
+                               unit.fan_direction1 | unit.fan_direction2 << 4, unit.humidity)
+        return struct.pack('<BBBBBBHHB', unit.room_id, unit.unit_id, 0x3f, unit.switch, unit.mode, unit.air_flow,
+                           unit.current_temp, unit.setted_temp, unit.fan_direction1 | unit.fan_direction2 << 4)
+
+    @staticmethod
+    def _control(unit: SimUnit, flag: int, b: bytes):
+        pos = 0
+        for bit, size, name in ((1, 1, 'switch'), (2, 1, 'mode'), (4, 1, 'air_flow'), (8, 2, 'current_temp'),
+                                (16, 2, 'setted_temp'), (32, 1, 'fan_direction'), (64, 1, 'humidity')):
+            if flag & bit and pos + size <= len(b):
+                v = b[pos] if size == 1 else struct.unpack_from('<H', b, pos)[0]
+                pos += size
+                if name == 'fan_direction':
+                    unit.fan_direction1, unit.fan_direction2 = v & 0xf, v >> 4 & 0xf
+                else:
+                    setattr(unit, name, v)
+
+    def sensor2_info_body(self) -> bytes:
+        sensors = self.topology.sensors
+        b = struct.pack('<BB', 1, len(sensors))
+        for s in sensors:
+            name = s.name.encode()
+            record = struct.pack('<BB6sB', 3, s.unit_id, s.mac, len(name)) + name
+            record += struct.pack('<BBHHHHBHH', 0x7f, 0, s.temp, s.humidity, s.pm25, s.co2, 1, s.tvoc, s.hcho)
+            record += struct.pack('<BHHHHHHHHBHHBB', 1, 350, 100, 800, 200, 75, 0, 1000, 0, 1, 60, 8, 1, 0)
+            b += struct.pack('<BB', s.room_id, len(record)) + record
+        return b
+
+    async def _push(self, writer: asyncio.StreamWriter):
+        units = self.topology.units
+        while not writer.is_closing():
+            await asyncio.sleep(1 / self.push_rate)
+            unit = random.choice(units)
+            unit.current_temp = max(150, min(350, unit.current_temp + random.choice((-5, 5))))
+            self.frames_out += 1
+            await self._send(writer, frame(self._next_cnt(), EnumDevice.NEWAIRCON, EnumCmdType.STATUS_CHANGED,
+                                           self.status_body(unit)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8008)
+    parser.add_argument('--rooms', type=int, default=4)
+    parser.add_argument('--units', type=int, default=1, help='new aircons per room')
+    parser.add_argument('--sensors', type=int, default=1, help='air sensors per room')
+    parser.add_argument('--gw', choices=('c611', 'b611'), default='c611')
+    parser.add_argument('--push-rate', type=float, default=0, help='STATUS_CHANGED pushes per second')
+    parser.add_argument('--latency', type=float, default=0, help='seconds before each answer')
+    parser.add_argument('--jitter', type=float, default=0, help='random extra latency in seconds')
+    parser.add_argument('--fragment', type=int, default=0, help='split writes into chunks of at most N bytes')
+    parser.add_argument('--disconnect-every', type=float, default=0, help='drop each connection after N seconds')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sim = GatewaySimulator(Topology(args.rooms, args.units, args.sensors), args.host, args.port,
+                           args.gw == 'c611', args.push_rate, args.latency, args.jitter, args.fragment,
+                           args.disconnect_every)
+
+    async def run():
+        await sim.start()
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import logging
+import time
+import typing
+
+from .ctrl_enum import EnumCmdType, EnumDevice
+from .stats import Histogram
+
+_LOGGER = logging.getLogger(__name__)
+
+_MAX_PENDING = 256
+_EXPIRE = 60.0
+
+
+class Trace:
+    __slots__ = ('key', 'cmd', 'target', 'room', 'unit', 'created', 'need_ack', 'enqueued', 'written', 'acked',
+                 'confirmed')
+
+    def __init__(self, key: str, cmd: str, target: EnumDevice, room: int, unit: int, created: float,
+                 need_ack: bool = True):
+        self.key = key
+        self.cmd = cmd
+        self.target = target
+        self.room = room
+        self.unit = unit
+        self.created = created
+        self.need_ack = need_ack
+        self.enqueued = 0.0
+        self.written = 0.0
+        self.acked = 0.0
+        self.confirmed = 0.0
+
+
+class _Latency:
+    __slots__ = ('write', 'ack', 'confirm')
+
+    def __init__(self):
+        self.write = Histogram()
+        self.ack = Histogram()
+        self.confirm = Histogram()
+
+    def snapshot(self) -> dict:
+        return {
+            'write': self.write.snapshot(),
+            'ack': self.ack.snapshot(),
+            'confirm': self.confirm.snapshot()
+        }
+
+
+class Tracer:
+    """stamps a Param from creation to the state confirmation of its unit"""
+    slow_threshold = 3.0  # type: float
+    _pending = {}  # type: typing.Dict[int, Trace]
+    _latency = {}  # type: typing.Dict[typing.Tuple[str, str], _Latency]
+
+    @staticmethod
+    def enqueued(p):
+        if p.target == EnumDevice.SYSTEM and p.cmd_type == EnumCmdType.SYS_ACK:
+            return  # heartbeat, tracked by Stats
+        device = getattr(p, 'device', None)
+        if device is not None:
+            key, room, unit = device.unique_id, device.room_id, device.unit_id
+        else:
+            key, room, unit = p.target.name, -1, -1
+        t = Trace(key, p.__class__.__name__, p.target, room, unit, p.created, bool(p.need_ack))
+        t.enqueued = time.monotonic()
+        pending = Tracer._pending
+        if len(pending) >= _MAX_PENDING:
+            Tracer._expire(t.enqueued)
+        pending[p.cmd_id] = t
+
+    @staticmethod
+    def written(p):
+        t = Tracer._pending.get(p.cmd_id)
+        if t is not None:
+            t.written = time.monotonic()
+            Tracer._get(t).write.observe(t.written - t.created)
+
+    @staticmethod
+    def acked(cmd_id: int):
+        t = Tracer._pending.get(cmd_id)
+        if t is not None and not t.acked:
+            t.acked = time.monotonic()
+            Tracer._get(t).ack.observe(t.acked - t.created)
+            # an ack may come after the state confirmation, the trace ends with whichever is last
+            if t.room < 0 or t.confirmed:
+                Tracer._finish(cmd_id, t)
+
+    @staticmethod
+    def confirmed(target: EnumDevice, room: int, unit: int):
+        now = time.monotonic()
+        # list() copies in one step, the sender thread may add traces meanwhile
+        done = [(k, t) for k, t in list(Tracer._pending.items())
+                if t.room == room and t.unit == unit and t.target == target and not t.confirmed]
+        for k, t in done:
+            Tracer._confirm(k, t, now)
+
+    @staticmethod
+    def answered(cmd_id: int):
+        """the reply to cmd_id repeats the known state, which confirms it without a status hook"""
+        t = Tracer._pending.get(cmd_id)
+        if t is not None and not t.confirmed:
+            Tracer._confirm(cmd_id, t, time.monotonic())
+
+    @staticmethod
+    def _confirm(cmd_id: int, t: Trace, now: float):
+        t.confirmed = now
+        Tracer._get(t).confirm.observe(now - t.created)
+        if t.acked or not t.need_ack:
+            Tracer._finish(cmd_id, t)
+
+    @staticmethod
+    def _finish(cmd_id: int, t: Trace):
+        Tracer._pending.pop(cmd_id, None)
+        elapsed = t.confirmed - t.created
+        if t.confirmed and elapsed > Tracer.slow_threshold:
+            _LOGGER.warning('slow command %s to %s: %.0f ms to state confirmation (write %.0f ms, ack %s)',
+                            t.cmd, t.key, elapsed * 1000, (t.written - t.created) * 1000,
+                            '%.0f ms' % ((t.acked - t.created) * 1000) if t.acked else
+                            'missing' if t.need_ack else 'not requested')
+
+    @staticmethod
+    def reset():
+        Tracer._pending = {}
+        Tracer._latency = {}
+
+    @staticmethod
+    def snapshot() -> dict:
+        res = {}
+        for (key, cmd), v in Tracer._latency.items():
+            res.setdefault(key, {})[cmd] = v.snapshot()
+        return res
+
+    @staticmethod
+    def _get(t: Trace) -> _Latency:
+        v = Tracer._latency.get((t.key, t.cmd))
+        if v is None:
+            v = Tracer._latency[(t.key, t.cmd)] = _Latency()
+        return v
+
+    @staticmethod
+    def _expire(now: float):
+        # confirmed traces still waiting for their ack end here, reported as slow with the ack missing
+        pending = Tracer._pending
+        for k, t in [(k, t) for k, t in list(pending.items()) if now - t.enqueued > _EXPIRE]:
+            Tracer._finish(k, t)
+        while len(pending) >= _MAX_PENDING:
+            k = next(iter(list(pending)))
+            t = pending.get(k)
+            if t is not None:
+                Tracer._finish(k, t)
@@ -2,21 +2,42 @@
 from typing import Optional
 
 from homeassistant.components.sensor import SensorEntity
-from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.core import callback
+from homeassistant.helpers.entity import DeviceInfo, EntityCategory
 
-from .const import DOMAIN, SENSOR_TYPES
+from .const import DOMAIN, SENSOR_TYPES, STATS_SENSOR_TYPES
 from .ds_air_service.dao import Sensor
 from .ds_air_service.service import Service
+from .ds_air_service.stats import Stats
 
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Perform the setup for Xiaomi devices."""
+    from . import async_remove_entity
     entities = []
     for device in Service.get_sensors():
         for key in SENSOR_TYPES:
             if config_entry.data.get(key):
                 entities.append(DsSensor(device, key))
     async_add_entities(entities)
+    async_add_entities([DsStatsSensor(key) for key in STATS_SENSOR_TYPES])
+
+    @callback
+    def topology_changed(added, removed):
+        new = []
+        for device in added:
+            if isinstance(device, Sensor):
+                for key in SENSOR_TYPES:
+                    if config_entry.data.get(key):
+                        new.append(DsSensor(device, key))
+        entities.extend(new)
+        async_add_entities(new)
+        for device in removed:
+            for entity in [j for j in entities if j.sensor_id == device.unique_id and isinstance(device, Sensor)]:
+                entities.remove(entity)
+                hass.async_create_task(async_remove_entity(hass, entity))
+
+    Service.register_topology_hook(lambda added, removed: hass.add_job(topology_changed, added, removed))
 
 
 class DsSensor(SensorEntity):
@@ -36,6 +57,11 @@ class DsSensor(SensorEntity):
     def name(self):
         return "%s_%s" % (self._data_key, self._unique_id)
 
+    @property
+    def sensor_id(self):
+        """Return the unique id of the gateway sensor behind this entity."""
+        return self._unique_id
+
     @property
     def unique_id(self):
         return "%s_%s" % (self._data_key, self._unique_id)
@@ -52,6 +78,11 @@ class DsSensor(SensorEntity):
     def available(self):
         return self._is_available
 
+    @property
+    def extra_state_attributes(self):
+        from . import stale_attributes
+        return stale_attributes(self._unique_id)
+
     @property
     def should_poll(self):
         return False
@@ -98,3 +129,44 @@ class DsSensor(SensorEntity):
         if not not_update:
             self.schedule_update_ha_state()
         return True
+
+
+class DsStatsSensor(SensorEntity):
+    """Transport metric of the gateway connection, disabled by default."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, key):
+        self._key = key
+
+    @property
+    def name(self):
+        return "ds_air_%s" % self._key
+
+    @property
+    def unique_id(self):
+        return "ds_air_stats_%s" % self._key
+
+    @property
+    def device_info(self) -> Optional[DeviceInfo]:
+        return {
+            "identifiers": {(DOMAIN, "gateway")},
+            "name": "网关",
+            "manufacturer": "DAIKIN INDUSTRIES, Ltd."
+        }
+
+    @property
+    def icon(self):
+        return STATS_SENSOR_TYPES[self._key][1]
+
+    @property
+    def unit_of_measurement(self):
+        return STATS_SENSOR_TYPES[self._key][0]
+
+    @property
+    def state(self):
+        value = Stats.snapshot()[self._key]
+        if STATS_SENSOR_TYPES[self._key][2] is not None:
+            return value[STATS_SENSOR_TYPES[self._key][2]]
+        return value
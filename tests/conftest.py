@@ -0,0 +1,7 @@
+import os
+import sys
+
+# ds_air_service runs without Home Assistant, the integration modules are imported as custom_components.ds_air
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'custom_components', 'ds_air'))
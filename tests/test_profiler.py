@@ -0,0 +1,29 @@
+import os
+import time
+
+from ds_air_service.profiler import Profiler
+
+
+def test_start_between_resume_and_pause(tmp_path):
+    resumed = Profiler.resume()
+    assert not resumed
+    assert Profiler.start(os.path.join(str(tmp_path), 'profile'), memory=False)
+    try:
+        Profiler.pause(resumed)
+        assert Profiler.is_running()
+        resumed = Profiler.resume()
+        assert resumed
+        Profiler.pause(resumed)
+    finally:
+        assert Profiler.stop() is not None
+    assert not Profiler.is_running()
+
+
+def test_stops_without_frames(tmp_path):
+    assert Profiler.start(os.path.join(str(tmp_path), 'profile'), duration=0.1, memory=False)
+    for _ in range(50):
+        if not Profiler.is_running():
+            break
+        time.sleep(0.05)
+    assert not Profiler.is_running()
+    assert os.path.exists(os.path.join(str(tmp_path), 'profile.txt'))
@@ -0,0 +1,11 @@
+from ds_air_service.stats import Stats
+
+
+def test_snapshot_frame_counters_are_totals():
+    Stats.reset()
+    Stats.frame_in(1, 20)
+    Stats.frame_in(2, 20)
+    Stats.frame_out(1, 20)
+    snapshot = Stats.snapshot()
+    assert snapshot['frames_in'] == 2
+    assert snapshot['frames_out'] == 1
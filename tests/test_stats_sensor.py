@@ -0,0 +1,21 @@
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.ds_air.const import STATS_SENSOR_TYPES
+from custom_components.ds_air.ds_air_service.stats import Stats
+from custom_components.ds_air.sensor import DsStatsSensor
+
+
+def test_frame_counters_are_totals():
+    Stats.reset()
+    Stats.frame_in(1, 20)
+    Stats.frame_in(2, 20)
+    Stats.frame_out(1, 20)
+    assert DsStatsSensor('frames_in').state == 2
+    assert DsStatsSensor('frames_out').state == 1
+
+
+def test_every_stats_sensor_is_a_number():
+    for key in STATS_SENSOR_TYPES:
+        assert isinstance(DsStatsSensor(key).state, (int, float)), key